@@ -33,10 +33,11 @@ import ctypes
 import logging
 import logging.handlers
 import datetime
+from os import remove
 from os.path import exists
 import spacepy
 from spacepy import pycdf
-from numpy import asarray
+from numpy import asarray, empty, subtract, isnan, datetime64, errstate
 
 SPACEPY_NAME = spacepy.__name__
 SPACEPY_VERSION = spacepy.__version__
@@ -194,6 +195,29 @@ def cdf_open(filename, mode="r"):
     return cdf
 
 
+def parse_compression_level(option, iargv):
+    """ Parse GZIP compression level (1-9) from the next command-line argument
+    and return it as a CDF compression parameter.
+    """
+    try:
+        level = int(next(iargv))
+    except StopIteration:
+        raise CommandError(f"Missing mandatory {option} option value!") from None
+    except ValueError:
+        raise CommandError(f"Invalid {option} option value!") from None
+    if not 1 <= level <= 9:
+        raise CommandError(f"The {option} option value must be between 1 and 9!")
+    return ctypes.c_long(level)
+
+
+def remove_file(filename):
+    """ Remove file if it exists. """
+    try:
+        remove(filename)
+    except FileNotFoundError:
+        pass
+
+
 class CdfTypeDummy():
     """ CDF dummy type conversions. """
 
@@ -211,13 +235,20 @@ class CdfTypeDummy():
 class CdfTypeEpoch():
     """ CDF Epoch Time type conversions. """
     CDF_EPOCH_1970 = 62167219200000.0
+    NAT = datetime64('NaT', 'ms')
 
     @classmethod
     def decode(cls, cdf_raw_time):
         """ Convert CDF raw time to datetime64[ms]. """
-        return asarray(
-            cdf_raw_time - cls.CDF_EPOCH_1970
-        ).astype('datetime64[ms]')
+        cdf_raw_time = asarray(cdf_raw_time)
+        # NOTE: The offset subtraction is cast directly to the integer output
+        #       array to avoid the intermediate floating point array.
+        time = empty(cdf_raw_time.shape, 'int64')
+        with errstate(invalid='ignore'): # NaNs are replaced by NaT below
+            subtract(cdf_raw_time, cls.CDF_EPOCH_1970, out=time, casting='unsafe')
+        time = time.view('datetime64[ms]')
+        time[isnan(cdf_raw_time)] = cls.NAT # the NaN cast is platform dependent
+        return time
 
     @classmethod
     def encode(cls, time):
@@ -33,10 +33,11 @@ import os.path
 import datetime
 import numpy
 from common import (
-    init_console_logging, CommandError, cdf_open,
+    init_console_logging, CommandError, cdf_open, remove_file,
+    parse_compression_level,
     SPACEPY_NAME, SPACEPY_VERSION, LIBCDF_VERSION,
     GZIP_COMPRESSION, GZIP_COMPRESSION_LEVEL4,
-    CDF_DOUBLE, CDF_EPOCH,
+    CDF_DOUBLE,
 )
 
 
@@ -66,7 +67,8 @@ class App:
         """ Print usage. """
         print(
             f"USAGE: {os.path.basename(exename)} <filename> [<output dir>]|"
-            "[--test <output-filename>]", file=file
+            "[--test <output-filename>] [--compression-level <level>]",
+            file=file
         )
         print("\n".join([
             "DESCRIPTION:",
@@ -75,6 +77,8 @@ class App:
             "  The output file is named using the Swarm-like naming convention.",
             "  With the --test option, the program tests the existing converted",
             "  file against the source.",
+            "  The --compression-level option sets the GZIP compression level",
+            "  (1-9) of the converted variables (default 4).",
         ]), file=file)
 
     @classmethod
@@ -84,11 +88,15 @@ class App:
         output_dir = None
         output_filename = None
         test_only = False
+        compress_param = None
         args = []
 
-        for arg in argv[1:]:
+        iargv = iter(argv[1:])
+        for arg in iargv:
             if arg == "--test":
                 test_only = True
+            elif arg == "--compression-level":
+                compress_param = parse_compression_level(arg, iargv)
             else:
                 args.append(arg)
 
@@ -113,58 +121,67 @@ class App:
             "input_filename": input_filename,
             "output_dir": output_dir,
             "tested_filename": output_filename,
+            "compress_param": compress_param,
         }
 
     @classmethod
-    def main(cls, input_filename, output_dir=None, tested_filename=None):
+    def main(cls, input_filename, output_dir=None, tested_filename=None,
+             compress_param=None):
         """ Main subroutine. """
-        if not tested_filename:
-            output_filename = cls.convert_champ_mag_product(
-                input_filename, output_dir
+        # the input product is opened once for both the conversion and test
+        with cdf_open(input_filename) as input_cdf:
+            if not tested_filename:
+                output_filename = cls.convert_champ_mag_product(
+                    input_cdf, input_filename, output_dir,
+                    compress_param=compress_param,
+                )
+            else:
+                output_filename = tested_filename
+            cls.test_converted_champ_mag_product(
+                input_cdf, input_filename, output_filename
             )
-        else:
-            output_filename = tested_filename
-        cls.test_converted_champ_mag_product(input_filename, output_filename)
 
     @classmethod
-    def convert_champ_mag_product(cls, input_filename, output_dir=None):
-        """ Convert CHAMP MAG product to a Swarm-like format.
+    def convert_champ_mag_product(cls, input_cdf, input_filename,
+                                  output_dir=None, compress_param=None):
+        """ Convert opened CHAMP MAG product to a Swarm-like format.
         The function return path to the produced output file.
         The output file is named using the Swarm-like naming schema.
         """
         if not output_dir:
             output_dir = os.path.dirname(input_filename)
 
-        with cdf_open(input_filename) as input_cdf:
-            product_id = ChampMagProduct.get_swarm_id(input_cdf)
-            tmp_filename = os.path.join(output_dir, f"{product_id}.tmp.cdf")
-            output_filename = os.path.join(output_dir, f"{product_id}.cdf")
+        product_id = ChampMagProduct.get_swarm_id(input_cdf)
+        tmp_filename = os.path.join(output_dir, f"{product_id}.tmp.cdf")
+        output_filename = os.path.join(output_dir, f"{product_id}.cdf")
 
-            cls.logger.info("converting %s -> %s", input_filename, output_filename)
+        cls.logger.info("converting %s -> %s", input_filename, output_filename)
 
-            if os.path.exists(tmp_filename):
-                os.remove(tmp_filename)
+        remove_file(tmp_filename)
 
-            try:
-                with cdf_open(tmp_filename, "w") as output_cdf:
-                    ChampMagProduct.convert(output_cdf, input_cdf)
+        try:
+            with cdf_open(tmp_filename, "w") as output_cdf:
+                ChampMagProduct.convert(
+                    output_cdf, input_cdf,
+                    compress_param=compress_param,
+                )
 
-                os.rename(tmp_filename, output_filename)
-            except:
-                if os.path.exists(tmp_filename):
-                    os.remove(tmp_filename)
-                raise
+            os.replace(tmp_filename, output_filename)
+        except:
+            remove_file(tmp_filename)
+            raise
 
         return output_filename
 
     @classmethod
-    def test_converted_champ_mag_product(cls, input_filename, output_filename):
-        """ Test CHAMP MAG product converted to a Swarm-like format.
+    def test_converted_champ_mag_product(cls, input_cdf, input_filename,
+                                         output_filename):
+        """ Test CHAMP MAG product converted to a Swarm-like format
+        against the opened source product.
         """
         cls.logger.info("testing converted %s -> %s", input_filename, output_filename)
-        with cdf_open(input_filename) as input_cdf:
-            with cdf_open(output_filename) as output_cdf:
-                ChampMagProduct.test_converted(output_cdf, input_cdf)
+        with cdf_open(output_filename) as output_cdf:
+            ChampMagProduct.test_converted(output_cdf, input_cdf)
 
 
 class ChampMagProduct:
@@ -182,6 +199,8 @@ class ChampMagProduct:
         "compress_param": GZIP_COMPRESSION_LEVEL4
     }
 
+    CHUNK_SIZE = 65536 # number of records copied at once
+
     RADIUS_ATTRIBUTES = {
         "DESCRIPTION": "geocentric radius",
         "UNIT": "m",
@@ -215,27 +234,35 @@ class ChampMagProduct:
         return cls.ID_TEMPLATE.format(start=start, end=end)
 
     @classmethod
-    def convert(cls, cdf_dst, cdf_src):
+    def convert(cls, cdf_dst, cdf_src, compress_param=None):
         """ Convert champ product to the Swarm-like format. """
+
+        def _copy_variable(variable_dst, variable_src, type_dst=None):
+            cls._copy_variable(
+                cdf_dst, cdf_src, variable_dst, variable_src, type_dst,
+                compress_param=compress_param,
+            )
+
         cls._set_global_attributes(cdf_dst, cdf_src)
-        cls._copy_variable(cdf_dst, cdf_src, "Timestamp", "EPOCH")
-        cls._copy_variable(cdf_dst, cdf_src, "Latitude", "GEO_LAT", CDF_DOUBLE)
-        cls._copy_variable(cdf_dst, cdf_src, "Longitude", "GEO_LON", CDF_DOUBLE)
+        _copy_variable("Timestamp", "EPOCH")
+        _copy_variable("Latitude", "GEO_LAT", CDF_DOUBLE)
+        _copy_variable("Longitude", "GEO_LON", CDF_DOUBLE)
         cls._copy_radius_from_altitude(
             cdf_dst, cdf_src, "Radius", "GEO_ALT", CDF_DOUBLE,
+            compress_param=compress_param,
         )
-        cls._copy_variable(cdf_dst, cdf_src, "F", "FGM_SCAL", CDF_DOUBLE)
-        cls._copy_variable(cdf_dst, cdf_src, "B_VFM", "FGM_VEC", CDF_DOUBLE)
-        cls._copy_variable(cdf_dst, cdf_src, "B_NEC", "NEC_VEC", CDF_DOUBLE)
-        cls._copy_variable(cdf_dst, cdf_src, "Flags_Position", "GEO_STAT")
-        cls._copy_variable(cdf_dst, cdf_src, "Flags_B", "FGM_FLAGS")
-        cls._copy_variable(cdf_dst, cdf_src, "Flags_q", "ASC_STAT")
-        cls._copy_variable(cdf_dst, cdf_src, "Mode_q", "ASC_MODE")
-        cls._copy_variable(cdf_dst, cdf_src, "q_ICRF_CRF", "ASC_QUAT", CDF_DOUBLE)
+        _copy_variable("F", "FGM_SCAL", CDF_DOUBLE)
+        _copy_variable("B_VFM", "FGM_VEC", CDF_DOUBLE)
+        _copy_variable("B_NEC", "NEC_VEC", CDF_DOUBLE)
+        _copy_variable("Flags_Position", "GEO_STAT")
+        _copy_variable("Flags_B", "FGM_FLAGS")
+        _copy_variable("Flags_q", "ASC_STAT")
+        _copy_variable("Mode_q", "ASC_MODE")
+        _copy_variable("q_ICRF_CRF", "ASC_QUAT", CDF_DOUBLE)
 
     @classmethod
     def _copy_variable(cls, cdf_dst, cdf_src, variable_dst, variable_src=None,
-                       type_dst=None):
+                       type_dst=None, compress_param=None):
         if not variable_src:
             variable_src = variable_dst
 
@@ -245,17 +272,38 @@ class ChampMagProduct:
             type_dst = var_src.type()
 
         attributes = dict(var_src.attrs)
-
-        cls._save_cdf_variable(cdf_dst, variable_dst, type_dst, var_src[...], {
+        attributes = {
             "ORIGINAL_NAME": variable_src,
             "UNIT": attributes.pop("UNIT", "-"),
             "DESCRIPTION": attributes.pop("INFO", ""),
             **attributes,
-        })
+        }
+
+        size = len(var_src)
+
+        if not var_src.rv() or size <= cls.CHUNK_SIZE:
+            cls._save_cdf_variable(
+                cdf_dst, variable_dst, type_dst, var_src[...], attributes,
+                compress_param=compress_param,
+            )
+            return
+
+        # large variables are copied by chunks of records to limit memory usage
+        cdf_dst.new(
+            variable_dst, type=type_dst, dims=var_src.shape[1:],
+            n_elements=var_src.nelems(),
+            **cls._get_variable_parameters(compress_param),
+        )
+        var_dst = cdf_dst.raw_var(variable_dst)
+        for start in range(0, size, cls.CHUNK_SIZE):
+            end = min(start + cls.CHUNK_SIZE, size)
+            var_dst[start:end] = var_src[start:end]
+        cdf_dst[variable_dst].attrs.update(attributes)
 
     @classmethod
     def _copy_radius_from_altitude(cls, cdf_dst, cdf_src, variable_dst,
-                                   variable_src=None, type_dst=None):
+                                   variable_src=None, type_dst=None,
+                                   compress_param=None):
         if not variable_src:
             variable_src = variable_dst
 
@@ -284,17 +332,24 @@ class ChampMagProduct:
             "ORIGINAL_NAME": variable_src,
             **cls.RADIUS_ATTRIBUTES,
             **attributes,
-        })
+        }, compress_param=compress_param)
+
+    @classmethod
+    def _get_variable_parameters(cls, compress_param=None):
+        if compress_param is None:
+            return cls.CDF_VARIABLE_PARAMETERS
+        return {**cls.CDF_VARIABLE_PARAMETERS, "compress_param": compress_param}
 
     @staticmethod
     def _altitude_km_to_radius_m(altitude_km, ref_radius_km):
         return 1e3 * (altitude_km + ref_radius_km)
 
     @classmethod
-    def _save_cdf_variable(cls, cdf, variable, cdf_type, data, attrs=None):
+    def _save_cdf_variable(cls, cdf, variable, cdf_type, data, attrs=None,
+                           compress_param=None):
         cdf.new(
             variable, data, cdf_type, dims=data.shape[1:],
-            **cls.CDF_VARIABLE_PARAMETERS,
+            **cls._get_variable_parameters(compress_param),
         )
         if attrs:
             cdf[variable].attrs.update(attrs)
@@ -303,17 +358,24 @@ class ChampMagProduct:
     def _set_global_attributes(cls, cdf_dst, cdf_src):
 
         # NOTE CDF.attrs.update() does not preserve time data type
-        for key, (head, *tail) in cdf_src.attrs.items():
-            cdf_dst.attrs.new(key, head, type=(
-                CDF_EPOCH if isinstance(head, datetime.datetime) else None
-            ))
-            for item in tail:
-                cdf_dst.attrs[key].append(item)
+        for key, attr_src in cdf_src.attrs.items():
+            cdf_dst.attrs.new(key)
+            attr_dst = cdf_dst.attrs[key]
+            # NOTE: the entry numbers are not necessarily contiguous
+            for index in range(attr_src.max_idx() + 1):
+                if not attr_src.has_entry(index):
+                    continue
+                # entries copied with the source types, including CDF_EPOCH
+                attr_dst.new(
+                    attr_src[index], type=attr_src.type(index), number=index
+                )
 
         cdf_dst.attrs.update({
             "TITLE": f"{cls.get_swarm_id(cdf_src)}.cdf",
             "SOURCE": os.path.basename(cdf_src.pathname),
-            "CREATED": f"{datetime.datetime.utcnow():%Y-%m-%dT%H:%M:%S}Z",
+            "CREATED": (
+                f"{datetime.datetime.now(datetime.timezone.utc):%Y-%m-%dT%H:%M:%S}Z"
+            ),
             "CREATOR": cls.CDF_CREATOR,
         })
 
@@ -321,6 +383,15 @@ class ChampMagProduct:
     def test_converted(cls, cdf_dst, cdf_src):
         """ Test converted CHAMP ME 3 MAG product. """
 
+        def _arrays_equal(dst, src):
+            if dst.dtype == src.dtype and dst.dtype.kind == "f":
+                # bit-wise comparison of the exactly copied floating point
+                # values is faster than the NaN-aware comparison
+                int_type = f"u{dst.dtype.itemsize}"
+                if numpy.array_equal(dst.view(int_type), src.view(int_type)):
+                    return True
+            return numpy.array_equal(dst, src, equal_nan=True)
+
         def _attrs_not_equal(dst, src):
             if isinstance(dst, (str, bytes)) or isinstance(src, (str, bytes)):
                 return dst != src
@@ -357,7 +428,7 @@ class ChampMagProduct:
                 raise TestError(f"Wrong {dst_key} attribute of {variable} variable!")
 
         def _test_copied_variable(dst, var_dst, src, var_src):
-            if not numpy.array_equal(var_dst[...], var_src[...], equal_nan=True):
+            if not _arrays_equal(var_dst[...], var_src[...]):
                 raise TestError(f"{dst} values do not match source {src} values!")
             _test_attribute(dst, var_dst.attrs, var_src.attrs, "DESCRIPTION", "INFO")
             for key in cls.TESTED_VARIABLE_ATTRIBUTES:
@@ -365,10 +436,9 @@ class ChampMagProduct:
 
         def _test_radius(dst, var_dst, src, var_src):
             ref_radius = var_src.attrs["REFRADIUS"]
-            if not numpy.array_equal(
+            if not _arrays_equal(
                 var_dst[...],
                 cls._altitude_km_to_radius_m(var_src[...], ref_radius),
-                equal_nan=True
             ):
                 raise TestError(f"{dst} values do not match source {src} values!")
             _test_new_radius_attribute(dst, var_dst.attrs, "DESCRIPTION")
@@ -35,9 +35,10 @@ import os.path
 import datetime
 import numpy
 from common import (
-    init_console_logging, CommandError, cdf_open,
+    init_console_logging, CommandError, cdf_open, remove_file,
+    parse_compression_level,
     SPACEPY_NAME, SPACEPY_VERSION, LIBCDF_VERSION,
-    GZIP_COMPRESSION, GZIP_COMPRESSION_LEVEL4,
+    GZIP_COMPRESSION, GZIP_COMPRESSION_LEVEL1, GZIP_COMPRESSION_LEVEL4,
     CDF_DOUBLE, CDF_REAL8, CDF_EPOCH, CDF_CHAR, CDF_UINT4,
 )
 
@@ -68,13 +69,15 @@ class App:
         """ Print usage. """
         print(
             f"USAGE: {os.path.basename(exename)} <filename> <output filename>"
-            " [--test]", file=file
+            " [--test] [--compression-level <level>]", file=file
         )
         print("\n".join([
             "DESCRIPTION:",
             "  Convert TOLEOS CON_EPH_2_ product to a VirES-friendly format.",
             "  With the --test option, the program tests the existing converted",
             "  file against the source.",
+            "  The --compression-level option sets the GZIP compression level",
+            "  (1-9) of the converted data variables (default 4).",
         ]), file=file)
 
     @classmethod
@@ -82,10 +85,14 @@ class App:
         """ Parse input arguments. """
         args = []
         test_only = False
+        compress_param = None
 
-        for arg in argv[1:]:
+        iargv = iter(argv[1:])
+        for arg in iargv:
             if arg == "--test":
                 test_only = True
+            elif arg == "--compression-level":
+                compress_param = parse_compression_level(arg, iargv)
             else:
                 args.append(arg)
 
@@ -100,38 +107,45 @@ class App:
             "input_filename": input_filename,
             "output_filename": output_filename,
             "test_only": test_only,
+            "compress_param": compress_param,
         }
 
     @classmethod
-    def main(cls, input_filename, output_filename, test_only=False):
+    def main(cls, input_filename, output_filename, test_only=False,
+             compress_param=None):
         """ Main subroutine. """
         if not test_only:
-            cls.convert_con_eph_product(input_filename, output_filename)
+            cls.convert_con_eph_product(
+                input_filename, output_filename,
+                compress_param=compress_param,
+            )
         try:
             cls.test_converted_con_eph_product(input_filename, output_filename)
         except TestError as error:
             raise CommandError(f"Test of the converted file failed! {error}") from None
 
     @classmethod
-    def convert_con_eph_product(cls, input_filename, output_filename):
+    def convert_con_eph_product(cls, input_filename, output_filename,
+                                compress_param=None):
         """ Convert CON_EPH_2_ product to a VirES-friendly format. """
         with cdf_open(input_filename) as input_cdf:
             tmp_filename = f"{output_filename}.tmp.cdf"
 
             cls.logger.info("converting %s -> %s", input_filename, output_filename)
 
-            if os.path.exists(tmp_filename):
-                os.remove(tmp_filename)
+            remove_file(tmp_filename)
 
             try:
                 with cdf_open(tmp_filename, "w") as output_cdf:
-                    ConjuntionProduct.convert(output_cdf, input_cdf)
+                    ConjuntionProduct.convert(
+                        output_cdf, input_cdf,
+                        compress_param=compress_param,
+                    )
 
-                os.rename(tmp_filename, output_filename)
+                os.replace(tmp_filename, output_filename)
 
             except:
-                if os.path.exists(tmp_filename):
-                    os.remove(tmp_filename)
+                remove_file(tmp_filename)
                 raise
 
     @classmethod
@@ -158,6 +172,9 @@ class ConjuntionProduct:
         "compress_param": GZIP_COMPRESSION_LEVEL4
     }
 
+    # the sorting indices are compressed with the fastest compression level
+    CDF_INDEX_COMPRESSION_PARAM = GZIP_COMPRESSION_LEVEL1
+
     SKIPED_ATTRIBUTES = ("INFO", "CREATOR")
 
     TYPE_CONVERSIONS = {
@@ -231,7 +248,7 @@ class ConjuntionProduct:
 
     RE_SC_MAPPING_PATTERN = re.compile(
         r"^Satellite ID of (?P<mission>\S+)(?: (?P<spacecraft>\S+))?"
-        r" = (?P<index>[0-9]+)$"
+        r" = (?P<index>[0-9]+)$", re.MULTILINE
     )
 
     SPACECRAFT_MAPPING = {
@@ -247,7 +264,7 @@ class ConjuntionProduct:
     }
 
     @classmethod
-    def convert(cls, cdf_dst, cdf_src):
+    def convert(cls, cdf_dst, cdf_src, compress_param=None):
         """ Convert CON_EPH_2_ product to a VirES-friendly format. """
 
         # setup spacecraft translation from integer index to ASCII 3 letter code
@@ -266,42 +283,70 @@ class ConjuntionProduct:
             """ Translate input CDF data type to the output one. """
             return cls.TYPE_CONVERSIONS.get(cdf_type, cdf_type)
 
+        # read all source variables in bulk before any processing
+        variables_src = {
+            variable: cdf_src.raw_var(variable) for variable in cdf_src
+        }
+        data_src = {
+            variable: var_src[...] for variable, var_src in variables_src.items()
+        }
+
         # generate sorting indices for the internal datasets
-        sorting_indices = cls._get_sorting_indices(cdf_src)
+        sorting_indices = cls._get_sorting_indices(data_src)
 
-        def _pick_sorting_index(variable):
-            """ Pick the right sorting index matching the variable name. """
-            for prefix, index in sorting_indices.items():
+        def _pick_dataset_prefix(variable):
+            """ Pick the dataset prefix matching the variable name. """
+            for prefix in sorting_indices:
                 if variable.startswith(prefix):
-                    return index
+                    return prefix
             raise ValueError(
-                f"Failed to sorting index matching the {variable!r} variable!"
+                f"Failed to find sorting index matching the {variable!r} variable!"
             )
 
-        # write the output product
-
-        cls._set_global_attributes(cdf_dst, cdf_src)
-
-        for variable in cdf_src:
-            var_src = cdf_src[variable]
+        def _is_expanded(variable):
+            """ True if the variable is going to be expanded. """
+            return (
+                data_src[variable].ndim > 1 and
+                variable in cls.EXPANDED_VARIABLES
+            )
 
-            options = {
-                "type_dst": _convert_data_type(var_src.type()),
-                "convert_data": _get_data_conversion(variable),
-                "index": _pick_sorting_index(variable),
-            }
+        # group the variables by the datasets before writing any output
+        # (the plain variables precede the expanded ones within each group)
+        datasets = {prefix: [] for prefix in sorting_indices}
+        for variable in variables_src:
+            datasets[_pick_dataset_prefix(variable)].append(variable)
+        for variables in datasets.values():
+            variables.sort(key=_is_expanded)
 
-            if len(var_src.shape) > 1 and variable in cls.EXPANDED_VARIABLES:
-                cls._expand_variable(
-                    cdf_dst, cdf_src, cls.EXPANDED_VARIABLES[variable],
-                    variable, **options,
-                )
-            else:
-                cls._copy_variable(cdf_dst, cdf_src, variable, **options)
+        # write the output product
 
-        # write the indices mapping the sorted values to the original order
+        cls._set_global_attributes(cdf_dst, cdf_src)
 
-        for prefix, index in sorting_indices.items():
+        for prefix, variables in datasets.items():
+            index = sorting_indices[prefix]
+
+            for variable in variables:
+                var_src = variables_src[variable]
+
+                options = {
+                    "type_dst": _convert_data_type(var_src.type()),
+                    "convert_data": _get_data_conversion(variable),
+                    "index": index,
+                    "compress_param": compress_param,
+                }
+
+                if _is_expanded(variable):
+                    cls._expand_variable(
+                        cdf_dst, cls.EXPANDED_VARIABLES[variable],
+                        var_src, data_src[variable], **options,
+                    )
+                else:
+                    cls._copy_variable(
+                        cdf_dst, variable, var_src, data_src[variable],
+                        **options,
+                    )
+
+            # write the index mapping the sorted values to the original order
             cls._save_cdf_variable(
                 cdf_dst, f"{prefix}index", CDF_UINT4,
                 cls._reverse_sorting_index(index),
@@ -312,6 +357,7 @@ class ConjuntionProduct:
                     ),
                     "UNIT": "-",
                 },
+                compress_param=cls.CDF_INDEX_COMPRESSION_PARAM,
             )
 
     @classmethod
@@ -320,59 +366,71 @@ class ConjuntionProduct:
 
         tested_variables = set()
 
+        # resolve the raw variables only once
+        variables_src = {variable: cdf_src.raw_var(variable) for variable in cdf_src}
+        variables_dst = {variable: cdf_dst.raw_var(variable) for variable in cdf_dst}
+
         def test_time_order(variable):
-            times = cdf_dst.raw_var(variable)[...]
-            if times.size > 1 and (times[1:] - times[:-1]).min() < 0:
+            times = variables_dst[variable][...]
+            if times.size > 1 and (times[1:] < times[:-1]).any():
                 raise TestError(f"Time variable {variable!r} is not sorted!")
 
         def test_variable(variable, index):
             tested_variables.add(variable)
-            data_src = cdf_src.raw_var(variable)[...]
-            data_dst = cdf_dst.raw_var(variable)[...]
-            if not numpy.array_equal(data_dst[index], data_src, equal_nan=True):
+            data_src = variables_src[variable][...]
+            data_dst = variables_dst[variable][...]
+            if not cls._arrays_equal(data_dst[index], data_src):
                 raise TestError(
                     f"Converted values do not match the source {variable!r} ones!"
                 )
 
-        def test_expanded_variable(variable, index):
+        def test_expanded_variable(variable, index, translate=None):
             tested_variables.add(variable)
-            data_src = cdf_src.raw_var(variable)[...]
-            data_dst = numpy.stack([
-                cdf_dst.raw_var(item)[...]
-                for item in cls.EXPANDED_VARIABLES[variable]
-            ], axis=-1)
-            if not numpy.array_equal(data_dst[index], data_src, equal_nan=True):
+            data_src = variables_src[variable][...]
+            items = cls.EXPANDED_VARIABLES[variable]
+            # compare the expanded components one by one
+            if data_src.ndim < 2 or data_src.shape[-1] != len(items):
                 raise TestError(
                     f"Converted values do not match the {variable!r} source!"
                 )
-
-        def test_expanded_satellite_variable(variable, index, mapping):
-            tested_variables.add(variable)
-            data_src = cdf_src.raw_var(variable)[...]
-            data_dst = numpy.stack([
-                translate_spacecraft(cdf_dst.raw_var(item)[...], mapping)
-                for item in cls.EXPANDED_VARIABLES[variable]
-            ], axis=-1)
-            if not numpy.array_equal(data_dst[index], data_src, equal_nan=True):
-                raise TestError(
-                    f"Converted values do not match the {variable!r} source!"
-                )
-
-        def translate_spacecraft(data, mapping):
-            return numpy.vectorize(
-                lambda symbol: mapping[symbol], otypes=["int"]
-            )(data)
+            for idx, item in enumerate(items):
+                data_dst = variables_dst[item][...]
+                if translate:
+                    data_dst = translate(data_dst, data_src.dtype)
+                if not cls._arrays_equal(data_dst[index], data_src[..., idx]):
+                    raise TestError(
+                        f"Converted values do not match the {variable!r} source!"
+                    )
+
+        def get_spacecraft_translator(mapping):
+            """ Get translation from the spacecraft codes to the source
+            integer indices via a sorted lookup table.
+            """
+            symbols = numpy.array(list(mapping), dtype="S3")
+            indices = numpy.array(list(mapping.values()), dtype="int")
+            order = numpy.argsort(symbols)
+            symbols, indices = symbols[order], indices[order]
+
+            def _translate_spacecraft(data, dtype):
+                position = numpy.searchsorted(symbols, data)
+                numpy.minimum(position, symbols.size - 1, out=position)
+                if not (symbols[position] == data).all():
+                    raise TestError("Unexpected spacecraft code detected!")
+                # lookup table cast to the source data type
+                return indices.astype(dtype, copy=False)[position]
+
+            return _translate_spacecraft
 
         # test sorted times
         test_time_order("crossover_time_1")
         test_time_order("plane_alignment_time")
 
         # test converted values
-        reverse_spacecraft_mapping = {
+        translate_spacecraft = get_spacecraft_translator({
             dst: src
             for src, dst in cls._extrat_spacecraft_mapping(cdf_src).items()
-        }
-        reverse_index = cdf_dst["crossover_index"][...]
+        })
+        reverse_index = variables_dst["crossover_index"][...]
 
         test_variable("crossover_time_difference", reverse_index)
         test_variable("crossover_latitude", reverse_index)
@@ -382,25 +440,25 @@ class ConjuntionProduct:
         test_expanded_variable("crossover_times", reverse_index)
         test_expanded_variable("crossover_altitudes", reverse_index)
         test_expanded_variable("crossover_local_solar_times", reverse_index)
-        test_expanded_satellite_variable(
-            "crossover_satellites", reverse_index, reverse_spacecraft_mapping
+        test_expanded_variable(
+            "crossover_satellites", reverse_index, translate_spacecraft
         )
 
-        reverse_index = cdf_dst["plane_alignment_index"][...]
-        if len(cdf_src["plane_alignment_time"].shape) == 1:
+        reverse_index = variables_dst["plane_alignment_index"][...]
+        if len(variables_src["plane_alignment_time"].shape) == 1:
             test_variable("plane_alignment_time", reverse_index)
         else:
             test_expanded_variable("plane_alignment_time", reverse_index)
         test_expanded_variable("plane_alignment_ltan", reverse_index)
         test_expanded_variable("plane_alignment_altitudes", reverse_index)
         test_expanded_variable("plane_alignment_ltan_rates", reverse_index)
-        test_expanded_satellite_variable(
-            "plane_alignment_satellites", reverse_index, reverse_spacecraft_mapping
+        test_expanded_variable(
+            "plane_alignment_satellites", reverse_index, translate_spacecraft
         )
 
         # check if there is any variable not tested
         not_tested_variables = [
-            variable for variable in cdf_src
+            variable for variable in variables_src
             if variable not in tested_variables
         ]
 
@@ -411,15 +469,15 @@ class ConjuntionProduct:
 
 
     @classmethod
-    def _get_sorting_indices(cls, cdf):
+    def _get_sorting_indices(cls, data):
 
         def _get_crossover_sorting_index():
-            times = cdf.raw_var("crossover_times")[:, 0]
-            delta_times = cdf.raw_var("crossover_time_difference")[:]
+            times = data["crossover_times"][:, 0]
+            delta_times = data["crossover_time_difference"]
             return cls._get_sorting_index(times, delta_times)
 
         def _get_plane_alignment_sorting_index():
-            times = cdf.raw_var("plane_alignment_time")[:]
+            times = data["plane_alignment_time"]
             if times.ndim == 2:
                 times = times[:, 0]
             return cls._get_sorting_index(times)
@@ -440,72 +498,87 @@ class ConjuntionProduct:
         return _translate_spacecraft
 
     @classmethod
-    def _expand_variable(cls, cdf_dst, cdf_src, variables_dst, variable_src,
-                         type_dst=None, convert_data=None, index=Ellipsis):
-        var_src = cdf_src.raw_var(variable_src)
-
+    def _expand_variable(cls, cdf_dst, variables_dst, var_src, data_src,
+                         type_dst=None, convert_data=None, index=Ellipsis,
+                         compress_param=None):
         if type_dst is None:
             type_dst = var_src.type()
 
+        # read the source attributes only once
+        attributes_src = dict(var_src.attrs)
+
         for idx, variable_dst in enumerate(variables_dst):
-            attributes = dict(var_src.attrs)
-            if variable_dst in cls.VARIABLE_DESCRIPTION:
-                attributes["DESCRIPTION"] = cls.VARIABLE_DESCRIPTION[variable_dst]
-            data = var_src[:, idx, ...]
+            data = data_src[:, idx, ...]
             if convert_data:
                 data, type_dst = convert_data(data)
 
             cls._save_cdf_variable(
-                cdf_dst, variable_dst, type_dst, data[index], attributes
+                cdf_dst, variable_dst, type_dst, data[index], attributes_src,
+                compress_param=compress_param,
             )
 
-    @classmethod
-    def _copy_variable(cls, cdf_dst, cdf_src, variable_dst, variable_src=None,
-                       type_dst=None, convert_data=None, index=Ellipsis):
-        if not variable_src:
-            variable_src = variable_dst
-
-        var_src = cdf_src.raw_var(variable_src)
+            # override the copied source description
+            if variable_dst in cls.VARIABLE_DESCRIPTION:
+                cdf_dst[variable_dst].attrs["DESCRIPTION"] = (
+                    cls.VARIABLE_DESCRIPTION[variable_dst]
+                )
 
+    @classmethod
+    def _copy_variable(cls, cdf_dst, variable_dst, var_src, data,
+                       type_dst=None, convert_data=None, index=Ellipsis,
+                       compress_param=None):
         if type_dst is None:
             type_dst = var_src.type()
 
-        data = var_src[...]
         if convert_data:
             data, type_dst = convert_data(data)
 
         cls._save_cdf_variable(
             cdf_dst, variable_dst, type_dst, data[index], var_src.attrs,
+            compress_param=compress_param,
         )
 
     @classmethod
-    def _save_cdf_variable(cls, cdf, variable, cdf_type, data, attrs=None):
+    def _save_cdf_variable(cls, cdf, variable, cdf_type, data, attrs=None,
+                           compress_param=None):
+        parameters = cls.CDF_VARIABLE_PARAMETERS
+        if compress_param is not None:
+            parameters = {**parameters, "compress_param": compress_param}
         cdf.new(
-            variable, data, cdf_type, dims=data.shape[1:],
-            **cls.CDF_VARIABLE_PARAMETERS,
+            variable, data, cdf_type, dims=data.shape[1:], **parameters,
         )
         if attrs:
             cdf[variable].attrs.update(attrs)
 
     @classmethod
     def _extrat_spacecraft_mapping(cls, cdf_src):
+        lines = list(cdf_src.attrs["INFO"])
 
-        def _parse_line(line):
-            match = cls.RE_SC_MAPPING_PATTERN.match(line)
+        def _parse_match(match):
             try:
-                record = match.groupdict()
                 return (
-                    int(record["index"]),
+                    int(match["index"]),
                     cls.SPACECRAFT_MAPPING[
-                        (record["mission"], record["spacecraft"])
+                        (match["mission"], match["spacecraft"])
                     ]
                 )
-            except (AttributeError, ValueError, KeyError) as error:
+            except (ValueError, KeyError) as error:
                 raise ValueError(
-                    f"Failed to parse spacecraft mapping from {line!r}!"
+                    f"Failed to parse spacecraft mapping from {match[0]!r}!"
                 ) from error
 
-        return dict(_parse_line(line) for line in cdf_src.attrs["INFO"])
+        # parse all lines by a single multi-line pattern scan
+        matches = list(cls.RE_SC_MAPPING_PATTERN.finditer("\n".join(lines)))
+
+        if len(matches) != len(lines):
+            matched_lines = set(match[0] for match in matches)
+            for line in lines:
+                if line not in matched_lines:
+                    raise ValueError(
+                        f"Failed to parse spacecraft mapping from {line!r}!"
+                    )
+
+        return dict(_parse_match(match) for match in matches)
 
     @classmethod
     def _set_global_attributes(cls, cdf_dst, cdf_src):
@@ -521,7 +594,9 @@ class ConjuntionProduct:
                 cdf_dst.attrs[key].append(item)
 
         cdf_dst.attrs.update({
-            "CREATED": f"{datetime.datetime.utcnow():%Y-%m-%dT%H:%M:%S}Z",
+            "CREATED": (
+                f"{datetime.datetime.now(datetime.timezone.utc):%Y-%m-%dT%H:%M:%S}Z"
+            ),
             "CREATOR": cls.CDF_CREATOR,
         })
 
@@ -530,6 +605,17 @@ class ConjuntionProduct:
         """ Get index mapping sorted array to its unsorted original. """
         return cls._get_sorting_index(index)
 
+    @staticmethod
+    def _arrays_equal(data1, data2):
+        """ Compare two arrays. NaN values are considered equal. """
+        if data1.shape != data2.shape:
+            return False
+        if data1.dtype.kind in ("f", "c") and data2.dtype.kind in ("f", "c"):
+            return bool((
+                (data1 == data2) | (numpy.isnan(data1) & numpy.isnan(data2))
+            ).all())
+        return numpy.array_equal(data1, data2)
+
     @staticmethod
     def _get_sorting_index(*columns):
         """ Get index sorting an array by multiple columns. """
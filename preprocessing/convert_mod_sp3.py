@@ -31,12 +31,12 @@ import re
 import sys
 from logging import getLogger
 from datetime import datetime
-from os import rename, remove
-from os.path import basename, splitext, exists
-from numpy import asarray, datetime64, timedelta64
+from os import replace
+from os.path import basename, splitext
+from numpy import empty, resize, datetime64, timedelta64
 from eoxmagmod import convert, GEOCENTRIC_CARTESIAN, GEOCENTRIC_SPHERICAL
 from common import (
-    setup_logging, cdf_open, CommandError,
+    setup_logging, cdf_open, remove_file, CommandError,
     SPACEPY_NAME, SPACEPY_VERSION, LIBCDF_VERSION,
     GZIP_COMPRESSION, GZIP_COMPRESSION_LEVEL4,
     CDF_DOUBLE, CDF_EPOCH, CdfTypeEpoch,
@@ -85,11 +85,6 @@ RE_PRODUCT_ID = re.compile(
     r'^[A-Z0-9_]+_(\d{8,8}T\d{6,6})_(\d{8,8}T\d{6,6})_[A-Z0-9_]+$'
 )
 
-RE_TIMESTAMP = re.compile(
-    r'^(?P<year>\d{4,4})(?P<month>\d{2,2})(?P<day>\d{2,2})T'
-    r'(?P<hour>\d{2,2})(?P<minute>\d{2,2})(?P<second>\d{2,2})'
-)
-
 
 def usage(exename, file=sys.stderr):
     """ Print usage. """
@@ -116,18 +111,17 @@ def main(filename_input, filename_output):
     """ main subroutine """
     filename_tmp = filename_output + ".tmp.cdf"
 
-    if exists(filename_tmp):
-        remove(filename_tmp)
+    remove_file(filename_tmp)
 
     try:
         convert_mod_sp3_product(filename_input, filename_tmp)
-        rename(filename_tmp, filename_output)
+        replace(filename_tmp, filename_output)
         LOGGER.info("%s -> %s", filename_input, filename_output)
     #except ConversionSkipped as exc:
     #    LOGGER.warning("%s skipped - %s", filename_input, exc)
-    finally:
-        if exists(filename_tmp):
-            remove(filename_tmp)
+    except:
+        remove_file(filename_tmp)
+        raise
 
 
 def convert_mod_sp3_product(filename_sp3, filename_cdf):
@@ -136,10 +130,6 @@ def convert_mod_sp3_product(filename_sp3, filename_cdf):
 
     header, time_gps, position_cart = read_sp3_data(filename_sp3)
 
-    position_sph = convert(
-        position_cart, GEOCENTRIC_CARTESIAN, GEOCENTRIC_SPHERICAL
-    )
-
     # NOTE: It is assumed the UTC to GPS clock offset is constant for the whole
     #       daily Swarm MOD product and there are no products before 1972-01-01.
     leap_seconds = load_leap_seconds()
@@ -154,23 +144,34 @@ def convert_mod_sp3_product(filename_sp3, filename_cdf):
     _check_value(header['base_pv'], 0, "P/V base")
     _check_value(header['n_sat'], 1, "number of spacecrafts")
 
-    time_utc = time_gps - timedelta64(utc_to_gps_offset, 's')
+    time_offset = timedelta64(utc_to_gps_offset, 's')
 
     # subset trimming times to stay within the product's nominal time extent
-    selection = (time_utc >= time_start) & (time_utc < time_end)
+    # NOTE: The selection is applied to the GPS times before the conversion
+    #       so that the time shift and the coordinates conversion are applied
+    #       to the retained records only.
+    selection = _get_time_selection(
+        time_gps, time_start + time_offset, time_end + time_offset
+    )
 
-    if not selection.all():
+    if selection is not None:
         LOGGER.warn(
             f"{basename(filename_sp3)}: The content of the product "
-            f"({datetime64(time_utc.min(), 's')}/"
-            f"{datetime64(time_utc.max(), 's')}) "
+            f"({datetime64(time_gps.min() - time_offset, 's')}/"
+            f"{datetime64(time_gps.max() - time_offset, 's')}) "
             "exceeds the nominal temporal extent of the product "
             f"({datetime64(time_start, 's')}/"
             f"{datetime64(time_end, 's') - timedelta64(1, 's')}) "
             "and it will be trimmed."
         )
-        time_utc = time_utc[selection]
-        position_sph = position_sph[selection]
+        time_gps = time_gps[selection]
+        position_cart = position_cart[selection]
+
+    time_utc = time_gps - time_offset
+
+    position_sph = convert(
+        position_cart, GEOCENTRIC_CARTESIAN, GEOCENTRIC_SPHERICAL
+    )
 
     with cdf_open(filename_cdf, "w") as cdf:
         cdf.attrs.update({
@@ -197,13 +198,14 @@ def convert_mod_sp3_product(filename_sp3, filename_cdf):
 def extract_time_range(product_id):
 
     def _parse_timestamp(timestamp):
-        match = RE_TIMESTAMP.match(timestamp)
-        if not match:
-            raise ValueError(f"Invalid product timestamp {timestamp}!")
-        return datetime64(
-            "{year}-{month}-{day}T{hour}:{minute}:{second}"
-            "".format(**match.groupdict()), 'ms'
-        )
+        # NOTE: The YYYYMMDDThhmmss format is already checked by RE_PRODUCT_ID.
+        try:
+            return datetime64(
+                f"{timestamp[0:4]}-{timestamp[4:6]}-{timestamp[6:8]}T"
+                f"{timestamp[9:11]}:{timestamp[11:13]}:{timestamp[13:15]}", 'ms'
+            )
+        except ValueError:
+            raise ValueError(f"Invalid product timestamp {timestamp}!") from None
 
     match = RE_PRODUCT_ID.match(product_id)
     if not match:
@@ -214,6 +216,22 @@ def extract_time_range(product_id):
     return start, end + timedelta64(1000, 'ms')
 
 
+def _get_time_selection(times, start, end):
+    """ Get selection of the records within the [start, end) time interval
+    or None if all records are selected.
+    """
+    if (times[1:] >= times[:-1]).all():
+        # sorted times - the selection is a contiguous slice of records
+        idx_start, idx_end = times.searchsorted([start, end])
+        if idx_start == 0 and idx_end == times.size:
+            return None
+        return slice(idx_start, idx_end)
+
+    # unsorted times - fallback to a boolean mask
+    selection = (times >= start) & (times < end)
+    return None if selection.all() else selection
+
+
 def _save_cdf_variable(cdf, variable, cdf_type, data, attrs=None):
     cdf.new(
         variable, data, cdf_type, dims=data.shape[1:], **COMMON_PARAM,
@@ -224,17 +242,28 @@ def _save_cdf_variable(cdf, variable, cdf_type, data, attrs=None):
 
 
 def read_sp3_data(filename_sp3):
-    times, positions  = [], []
     with open(filename_sp3) as fin:
         header, records = read_sp3(fin)
-        for record in records:
-            times.append(record['timestamp'])
-            positions.append((record['px'], record['py'], record['pz']))
-    return (
-        header,
-        asarray(times, 'datetime64[ms]'),
-        asarray(positions, 'float64') * 1e3, # km -> m
-    )
+
+        # preallocate the output arrays from the header record counts
+        size = header['n_epoch'] * header['n_sat']
+        times = empty(size, 'datetime64[ms]')
+        positions = empty((size, 3), 'float64')
+
+        count = 0
+        for count, record in enumerate(records, 1):
+            if count > size: # more records than declared by the header
+                size = 2 * count
+                times = resize(times, size)
+                positions = resize(positions, (size, 3))
+            times[count - 1] = record['timestamp']
+            positions[count - 1] = (record['px'], record['py'], record['pz'])
+
+    times = times[:count]
+    positions = positions[:count]
+    positions *= 1e3 # km -> m
+
+    return header, times, positions
 
 
 def _check_value(value, expected, label):
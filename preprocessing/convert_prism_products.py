@@ -29,15 +29,16 @@
 import re
 import sys
 from logging import getLogger
-from datetime import datetime
+from datetime import datetime, timezone
 from os import rename, remove
 from os.path import basename, exists
-from numpy import asarray, argsort, arange, isnan
-from numpy.lib.stride_tricks import as_strided
+from numpy import (
+    asarray, argsort, empty, zeros, isnan, logical_not, flatnonzero,
+)
 from common import (
     setup_logging, cdf_open, CommandError,
     SPACEPY_NAME, SPACEPY_VERSION, LIBCDF_VERSION,
-    GZIP_COMPRESSION, GZIP_COMPRESSION_LEVEL4,
+    GZIP_COMPRESSION, GZIP_COMPRESSION_LEVEL1, GZIP_COMPRESSION_LEVEL4,
     CDF_UINT1, CDF_UINT4, CDF_EPOCH,
 )
 
@@ -55,20 +56,35 @@ PRODUCT_TYPES = {
         re.compile("^PPI[ABC]FAC_2F"), re.compile("^SW_OPER_PPI[ABC]FAC_2F_"),
     ),
 }
+# single pattern matching all supported file types at once
+RE_PRODUCT_TYPE = re.compile("|".join(
+    f"(?P<{product_type}>{type_filter.pattern})"
+    for product_type, (type_filter, _) in PRODUCT_TYPES.items()
+))
 CONVERT_FUNCTION = {}
 
 CDF_CREATOR = "EOX:convert_prism_products-%s [%s-%s, libcdf-%s]" % (
     VERSION, SPACEPY_NAME, SPACEPY_VERSION, LIBCDF_VERSION
 )
 
+FILE_TYPE_SUFFIX = ":VirES"
+
 # save variables
 COMMON_PARAM = dict(
     compress=GZIP_COMPRESSION,
     compress_param=GZIP_COMPRESSION_LEVEL4
 )
 
+# save index and point type variables (faster compression)
+INDEX_PARAM = dict(
+    compress=GZIP_COMPRESSION,
+    compress_param=GZIP_COMPRESSION_LEVEL1
+)
+
 PQ_NOT_DEFINED = -2 # Position_Quality flag - position not defined
 
+CHUNK_SIZE = 65536 # number of records copied at once
+
 
 CDF_VARIABLE_ATTRIBUTES = {
     "SourceRowIndex_ID": {
@@ -83,6 +99,29 @@ CDF_VARIABLE_ATTRIBUTES = {
     },
 }
 
+# point type lookup tables indexed by the source product columns
+POINT_TYPES = {
+    "MITx_LP_2F": asarray([
+        0b000, # LP MIT equatorward edge of the equatorward wall
+        0b001, # LP MIT poleward edge of the equatorward wall
+        0b010, # LP MIT equatorward edge of poleward wall
+        0b011, # LP MIT poleward edge of the poleward boundary
+        0b100, # LP Te equatorward bounding position
+        0b110, # LP Te peak position
+        0b101, # LP Te poleward bounding position
+    ], "uint8"),
+    "MITxTEC_2F": asarray([
+        0b000, # TEC MIT equatorward edge of the equatorward wall
+        0b001, # TEC MIT poleward edge of the equatorward wall
+        0b010, # TEC MIT equatorward edge of poleward wall
+        0b011, # TEC MIT poleward edge of the poleward boundary
+    ], "uint8"),
+    "PPIxFAC_2F": asarray([
+        0b000, # Equatorward edge of SSFAC boundary
+        0b001, # Poleward edge of SSFAC boundary
+    ], "uint8"),
+}
+
 CDF_POINT_TYPE_ATTRIBUTES = {
     "MITx_LP_2F": {
         "DESCRIPTION": (
@@ -171,8 +210,11 @@ def convert_prism_products(filename_input, filename_output):
     """ Convert MITx_LP, MITxTEC and PPIxFAC products. """
 
     def _get_product_type(file_type, file_name):
-        for product_type, (type_filter, name_filter) in PRODUCT_TYPES.items():
-            if type_filter.match(file_type) and name_filter.match(file_name):
+        match = RE_PRODUCT_TYPE.match(file_type)
+        if match:
+            product_type = match.lastgroup
+            _, name_filter = PRODUCT_TYPES[product_type]
+            if name_filter.match(file_name):
                 if file_type.endswith(":VirES"):
                     raise ConversionSkipped("already converted product")
                 return product_type
@@ -213,7 +255,9 @@ def convert_mit_lp(cdf_dst, cdf_src):
         "PW_Gradient",
         "Quality",
     ])
-    index, row_mapping, col_mapping = _get_unpacked_index(cdf_src)
+    index, row_mapping, col_mapping, time_extent = _get_unpacked_index(cdf_src)
+    _save_point_type(cdf_dst, col_mapping, product_type="MITx_LP_2F")
+    _save_row_col_mapping(cdf_dst, row_mapping, col_mapping)
     _copy_mapped_variables(cdf_dst, cdf_src, row_mapping=row_mapping, variables={
         "Counter_ID": "Counter",
     })
@@ -231,17 +275,9 @@ def convert_mit_lp(cdf_dst, cdf_src):
         "Te_ID",
         "Position_Quality_ID",
     ])
-    _save_point_type(cdf_dst, col_mapping, point_types=[
-        0b000, # LP MIT equatorward edge of the equatorward wall
-        0b001, # LP MIT poleward edge of the equatorward wall
-        0b010, # LP MIT equatorward edge of poleward wall
-        0b011, # LP MIT poleward edge of the poleward boundary
-        0b100, # LP Te equatorward bounding position
-        0b110, # LP Te peak position
-        0b101, # LP Te poleward bounding position
-    ], product_type="MITxTEC_2F")
-    _save_row_col_mapping(cdf_dst, row_mapping, col_mapping)
-    _add_time_extent_attribute(cdf_dst, ["Timestamp", "Timestamp_ID"])
+    _add_time_extent_attribute(cdf_dst, [
+        _get_time_extent(cdf_src.raw_var("Timestamp")[...]), time_extent,
+    ])
 
 CONVERT_FUNCTION["MITx_LP_2F"] = convert_mit_lp
 
@@ -271,7 +307,9 @@ def convert_mit_tec(cdf_dst, cdf_src):
         "PW_Gradient",
         "Quality",
     ])
-    index, row_mapping, col_mapping = _get_unpacked_index(cdf_src)
+    index, row_mapping, col_mapping, time_extent = _get_unpacked_index(cdf_src)
+    _save_point_type(cdf_dst, col_mapping, product_type="MITxTEC_2F")
+    _save_row_col_mapping(cdf_dst, row_mapping, col_mapping)
     _copy_mapped_variables(cdf_dst, cdf_src, row_mapping=row_mapping, variables={
         "Counter_ID": "Counter",
     })
@@ -288,14 +326,9 @@ def convert_mit_tec(cdf_dst, cdf_src):
         "TEC_ID",
         "Position_Quality_ID",
     ])
-    _save_point_type(cdf_dst, col_mapping, point_types=[
-        0b000, # TEC MIT equatorward edge of the equatorward wall
-        0b001, # TEC MIT poleward edge of the equatorward wall
-        0b010, # TEC MIT equatorward edge of poleward wall
-        0b011, # TEC MIT poleward edge of the poleward boundary
-    ], product_type="MITxTEC_2F")
-    _save_row_col_mapping(cdf_dst, row_mapping, col_mapping)
-    _add_time_extent_attribute(cdf_dst, ["Timestamp", "Timestamp_ID"])
+    _add_time_extent_attribute(cdf_dst, [
+        _get_time_extent(cdf_src.raw_var("Timestamp")[...]), time_extent,
+    ])
 
 CONVERT_FUNCTION["MITxTEC_2F"] = convert_mit_tec
 
@@ -321,7 +354,9 @@ def convert_ppi_fac(cdf_dst, cdf_src):
         "dL",
         "Quality",
     ])
-    index, row_mapping, col_mapping = _get_unpacked_index(cdf_src)
+    index, row_mapping, col_mapping, time_extent = _get_unpacked_index(cdf_src)
+    _save_point_type(cdf_dst, col_mapping, product_type="PPIxFAC_2F")
+    _save_row_col_mapping(cdf_dst, row_mapping, col_mapping)
     _copy_mapped_variables(cdf_dst, cdf_src, row_mapping=row_mapping, variables={
         "Counter_ID": "Counter",
     })
@@ -337,108 +372,137 @@ def convert_ppi_fac(cdf_dst, cdf_src):
         "SZA_ID",
         "Position_Quality_ID",
     ])
-    _save_point_type(cdf_dst, col_mapping, point_types=[
-        0b000, # Equatorward edge of SSFAC boundary
-        0b001, # Poleward edge of SSFAC boundary
-    ], product_type="PPIxFAC_2F")
-    _save_row_col_mapping(cdf_dst, row_mapping, col_mapping)
-    _add_time_extent_attribute(cdf_dst, ["Timestamp", "Timestamp_ID"])
+    _add_time_extent_attribute(cdf_dst, [
+        _get_time_extent(cdf_src.raw_var("Timestamp")[...]), time_extent,
+    ])
 
 CONVERT_FUNCTION["PPIxFAC_2F"] = convert_ppi_fac
 
 
-def _add_time_extent_attribute(cdf, time_variables):
-    min_time, max_time = None, None
-    for time_variable in time_variables:
-        times = cdf.raw_var(time_variable)[...]
-        try:
-            min_time = (
-                times.min() if min_time is None else min(min_time, times.min())
-            )
-            max_time = (
-                times.max() if max_time is None else max(max_time, times.max())
-            )
-        except ValueError:
-            pass # ignore the empty time-array
-
-    if min_time is not None or max_time is not None:
+def _add_time_extent_attribute(cdf, time_extents):
+    # NOTE: The time extents are calculated from the raw CDF_EPOCH times
+    #       already available in memory rather than by reading back
+    #       the just written (compressed) output variables.
+    time_extents = [extent for extent in time_extents if extent is not None]
+
+    if time_extents:
+        min_times, max_times = zip(*time_extents)
         attr_name = "TIME_EXTENT"
         cdf.attrs.new(attr_name)
         cdf.attrs[attr_name].new(
-            data=[min_time, max_time],
+            data=[min(min_times), max(max_times)],
             type=CDF_EPOCH,
             number=0,
         )
 
+
+def _get_time_extent(times):
+    """ Get (min, max) extent of the raw times or None for an empty array. """
+    return (times.min(), times.max()) if times.size else None
+
+
 def _save_row_col_mapping(cdf_dst, row_mapping, col_mapping):
     _save_variable(
         cdf_dst, "SourceRowIndex_ID", CDF_UINT4, row_mapping,
-        CDF_VARIABLE_ATTRIBUTES["SourceRowIndex_ID"],
+        CDF_VARIABLE_ATTRIBUTES["SourceRowIndex_ID"], INDEX_PARAM,
     )
     _save_variable(
         cdf_dst, "SourceColIndex_ID", CDF_UINT1, col_mapping,
-        CDF_VARIABLE_ATTRIBUTES["SourceColIndex_ID"],
+        CDF_VARIABLE_ATTRIBUTES["SourceColIndex_ID"], INDEX_PARAM,
     )
 
 
-def _save_point_type(cdf_dst, col_mapping, point_types, product_type):
+def _save_point_type(cdf_dst, col_mapping, product_type):
+    point_type = POINT_TYPES[product_type].take(col_mapping)
     _save_variable(
-        cdf_dst, "PointType_ID", CDF_UINT1, asarray(point_types)[col_mapping],
-        CDF_POINT_TYPE_ATTRIBUTES[product_type]
+        cdf_dst, "PointType_ID", CDF_UINT1, point_type,
+        CDF_POINT_TYPE_ATTRIBUTES[product_type], INDEX_PARAM,
     )
 
 
 def _get_unpacked_index(cdf_src):
-    nrow, ncol = cdf_src.raw_var("Timestamp_ID").shape
-    times = cdf_src.raw_var("Timestamp_ID")[...].flatten()
-    quality = cdf_src.raw_var("Position_Quality_ID")[...].flatten()
-    row_mapping, col_mapping = _get_row_col_mapping(nrow, ncol)
-    index = argsort(times)
+    times = cdf_src.raw_var("Timestamp_ID")[...]
+    _, ncol = times.shape
+    times = times.ravel()
     # NOTE: the Position_Quality_ID is not reliable to filter out invalid records
-    #index = index[quality[index] != PQ_NOT_DEFINED]
-    mask = ~(
-        isnan(cdf_src.raw_var("Latitude_ID")[...].flatten()[index]) |
-        isnan(cdf_src.raw_var("Longitude_ID")[...].flatten()[index]) |
-        isnan(cdf_src.raw_var("Radius_ID")[...].flatten()[index])
-    )
-    index = index[mask]
-    return index, row_mapping[index], col_mapping[index]
-
-
-def _get_row_col_mapping(nrow, ncol):
-    rows, cols = arange(nrow), arange(ncol)
-    return (
-        as_strided(
-            rows, (nrow, ncol), rows.strides + (0,), writeable=False
-        ).flatten(),
-        as_strided(
-            cols, (nrow, ncol), (0,) + cols.strides, writeable=False
-        ).flatten(),
-    )
+    #quality = cdf_src.raw_var("Position_Quality_ID")[...].ravel()
+    #index = flatnonzero(quality != PQ_NOT_DEFINED)
+    # filter out invalid records first and sort the valid ones only
+    # NOTE: The mask is updated in place to avoid temporary arrays and
+    #       to keep only one of the position arrays loaded at a time.
+    is_invalid = zeros(times.shape, "bool")
+    for variable in ["Latitude_ID", "Longitude_ID", "Radius_ID"]:
+        is_invalid |= isnan(cdf_src.raw_var(variable)[...].ravel())
+    index = flatnonzero(logical_not(is_invalid, out=is_invalid))
+    times = times[index]
+    # skip the sorting if the valid times are already in ascending order
+    first, last = 0, -1
+    if (times[1:] < times[:-1]).any():
+        # NOTE: The non-negative CDF_EPOCH values keep their order when
+        #       reinterpreted as 64-bit integers which sort faster than
+        #       the floating point numbers. Times with the sign bit set,
+        #       e.g., the negative fill values, are sorted as floats.
+        keys = times.view("int64")
+        if keys.min() < 0:
+            keys = times
+        order = argsort(keys, kind="stable")
+        index = index[order]
+        first, last = order[0], order[-1]
+    # the time extent of the unpacked records is given by the sorted times
+    time_extent = (times[first], times[last]) if times.size else None
+    # derive the source rows and columns directly from the flat index
+    row_mapping, col_mapping = divmod(index, ncol)
+    return index, row_mapping, col_mapping, time_extent
 
 
 def _copy_variables(cdf_dst, cdf_src, variables):
+    # NOTE: The variables are copied sequentially on purpose. The libcdf
+    #       calls operate on a shared per-process selection state and are not
+    #       thread-safe, i.e., neither the reads nor the compressed writes
+    #       can be safely spread over multiple threads.
     for variable in variables:
         _copy_variable(cdf_dst, cdf_src, variable)
 
 
-def _copy_variable(cdf_dst, cdf_src, variable):
+def _copy_variable(cdf_dst, cdf_src, variable, chunk_size=CHUNK_SIZE):
     raw_var = cdf_src.raw_var(variable)
-    _save_variable(
-        cdf_dst, variable, raw_var.type(), raw_var[...], raw_var.attrs,
+    size = len(raw_var)
+
+    if not raw_var.rv() or size <= chunk_size:
+        _save_variable(
+            cdf_dst, variable, raw_var.type(), raw_var[...], raw_var.attrs,
+        )
+        return
+
+    # large variables are copied by chunks of records to limit memory usage
+    cdf_dst.new(
+        variable, type=raw_var.type(), dims=raw_var.shape[1:],
+        n_elements=raw_var.nelems(), **COMMON_PARAM,
     )
+    var_dst = cdf_dst.raw_var(variable)
+    for start in range(0, size, chunk_size):
+        end = min(start + chunk_size, size)
+        var_dst[start:end] = raw_var[start:end]
+    var_dst.attrs.update(raw_var.attrs)
 
 
 def _copy_packed_variables(cdf_dst, cdf_src, variables, index):
+    buffers = {} # output buffers shared by the variables of the same type
     for variable in variables:
-        _copy_packed_variable(cdf_dst, cdf_src, variable, index)
+        _copy_packed_variable(cdf_dst, cdf_src, variable, index, buffers)
 
 
-def _copy_packed_variable(cdf_dst, cdf_src, variable, index):
+def _copy_packed_variable(cdf_dst, cdf_src, variable, index, buffers=None):
     raw_var = cdf_src.raw_var(variable)
+    data = raw_var[...].ravel()
+    buffer_ = None
+    if buffers is not None:
+        buffer_ = buffers.get(data.dtype)
+        if buffer_ is None:
+            buffer_ = buffers[data.dtype] = empty(index.shape, data.dtype)
     _save_variable(
         cdf_dst, variable, raw_var.type(),
-        raw_var[...].flatten()[index], raw_var.attrs,
+        data.take(index, out=buffer_), raw_var.attrs,
     )
 
 
@@ -457,18 +521,21 @@ def _copy_mapped_variable(cdf_dst, cdf_src, variable_src, variable_dst, row_mapp
     )
 
 
-def _save_variable(cdf, variable, cdf_type, data, attrs):
+def _save_variable(cdf, variable, cdf_type, data, attrs,
+                   compress_params=COMMON_PARAM):
+    # NOTE: The variable returned by new() is reused to set the attributes
+    #       to avoid another look-up of the just created variable by its name.
     cdf.new(
-        variable, data, cdf_type, dims=data.shape[1:], **COMMON_PARAM,
-    )
-    cdf[variable].attrs.update(attrs)
+        variable, data, cdf_type, dims=data.shape[1:], **compress_params,
+    ).attrs.update(attrs)
 
 
 def _set_file_type(cdf_dst):
-    cdf_dst.attrs["File_Type"] = (
-        str(cdf_dst.attrs.get("File_Type", "")) or
-        basename(str(cdf_dst.attrs["File_Name"]))[8:18]
-    ) + ":VirES"
+    file_type = cdf_dst.attrs.get("File_Type")
+    file_type = str(file_type) if file_type is not None else ""
+    if not file_type: # fallback - extract file type from the file name
+        file_type = basename(str(cdf_dst.attrs["File_Name"]))[8:18]
+    cdf_dst.attrs["File_Type"] = file_type + FILE_TYPE_SUFFIX
 
 
 def _update_creator(cdf):
@@ -478,14 +545,15 @@ def _update_creator(cdf):
 
     cdf.attrs.update({
         "CREATOR": CDF_CREATOR,
-        "CREATED": (
-            datetime.utcnow().replace(microsecond=0)
-        ).isoformat() + "Z",
+        "CREATED": f"{datetime.now(timezone.utc):%Y-%m-%dT%H:%M:%S}Z",
     })
 
 
 def _copy_attributes(cdf_dst, cdf_src):
-    cdf_dst.attrs.update(cdf_src.attrs)
+    # read all source attributes in one pass before writing them
+    attributes = {key: attr[...] for key, attr in cdf_src.attrs.items()}
+    for key, values in attributes.items():
+        cdf_dst.attrs[key] = values
 
 
 if __name__ == "__main__":
@@ -39,9 +39,18 @@ import re
 import os
 import os.path
 import io
+import errno
+import shutil
 import json
+import hashlib
+import zlib
+import gzip
+import sqlite3
 import collections
 import logging
+import threading
+import queue
+import concurrent.futures
 import datetime
 import http.client
 import urllib.parse
@@ -49,7 +58,7 @@ import email.utils
 import numpy
 from common import (
     LOG_LEVELS, init_console_logging, init_file_logging,
-    cdf_open, CommandError,
+    cdf_open, remove_file, CommandError,
     SPACEPY_NAME, SPACEPY_VERSION, LIBCDF_VERSION,
     GZIP_COMPRESSION, GZIP_COMPRESSION_LEVEL4,
     CDF_UINT1, CDF_INT2, CDF_EPOCH, CDF_DOUBLE, CdfTypeEpoch,
@@ -104,7 +113,8 @@ class App:
             "  When requested, the old replaced indices are removed.",
             "  Optionally, a custom directory to hold intermediate temporary",
             "  files can be specified. By default, all temporary files",
-            "  are held in the output directory. "
+            "  are held in the output directory. The temporary directory",
+            "  may be on a different file-system (e.g., /dev/shm).",
             "  The program caches the source monthly files in the cache",
             "  directory (<temp.dir>/cache/)`",
         ]), file=file)
@@ -226,11 +236,11 @@ class App:
                 ranges, check_for_updates=check_for_updates
             )
 
-        if not force_write:
-            chunks = dst_store.filter_unchanged_chunks(chunks)
+            if not force_write:
+                chunks = dst_store.filter_unchanged_chunks(chunks)
 
-        for chunk in chunks:
-            dst_store.save_chunk(chunk)
+            for chunk in chunks:
+                dst_store.save_chunk(chunk)
 
         if delete_old:
             dst_store.delete_old()
@@ -255,15 +265,15 @@ class DstProductStore:
         "{timestamp:%Y%m%dT%H%M%S}"
     )
 
-    FILENAME_PATTERN = re.compile(
-        r"^WDC_DST_(?P<start>\d{8,8}T\d{6,6})"
-        r"_(?P<end>\d{8,8}T\d{6,6})"
-        r"_(?P<timestamp>\d{8,8}T\d{6,6})\.cdf$"
-    )
-
-    TIMESTAP_PATTERN = re.compile(
-        r"^(?P<year>\d{4,4})(?P<day>\d{4,4})T\d{6,6}$"
-    )
+    # WDC_DST_<start>_<end>_<timestamp>.cdf filename parts' slices
+    FILENAME_PREFIX = "WDC_DST_"
+    FILENAME_SUFFIX = ".cdf"
+    FILENAME_LENGTH = 59
+    FILENAME_SLICES = {
+        "start": slice(8, 23),
+        "end": slice(24, 39),
+        "timestamp": slice(40, 55),
+    }
 
     def __init__(self, output_dir=None, temp_dir=None, logger=None):
 
@@ -287,7 +297,7 @@ class DstProductStore:
             self.logger.info("Removing Dst data file %s ...", path)
             try:
                 os.remove(path)
-            except Exception as error:
+            except OSError as error:
                 self.logger.error(
                     "Failed to remove Dst data file %s. %s", path, error
                 )
@@ -309,6 +319,15 @@ class DstProductStore:
                 return True # no previous data found
 
             self.logger.debug("Found existing data in %s", filename)
+            try:
+                old_content_hash = DstProduct.load_content_hash(filename)
+            except:
+                old_content_hash = None
+
+            if old_content_hash == DstProduct.get_content_hash(chunk.data):
+                self.logger.debug("Dst data has not changed.")
+                return False # previous data are identical
+
             try:
                 old_data = DstProduct.load(filename)
             except:
@@ -342,16 +361,39 @@ class DstProductStore:
 
         self.logger.info("Saving Dst data to %s ...", filename)
 
-        if os.path.exists(filename_tmp):
-            os.remove(filename_tmp)
+        remove_file(filename_tmp)
 
         try:
             DstProduct.save(filename_tmp, chunk.data, chunk.metadata)
-            os.rename(filename_tmp, filename)
+            self._move_file(filename_tmp, filename)
 
         finally:
-            if os.path.exists(filename_tmp):
-                os.remove(filename_tmp)
+            remove_file(filename_tmp)
+
+    @staticmethod
+    def _move_file(source, target):
+        """ Atomically move the source file to the target location.
+        The temporary directory may be on a different file-system
+        (e.g., a RAM-based tmpfs) in which case the file is copied next
+        to the target first.
+        """
+        try:
+            os.replace(source, target)
+        except OSError as error:
+            if error.errno != errno.EXDEV:
+                raise
+        else:
+            return
+
+        target_tmp = os.path.join(
+            os.path.dirname(target), os.path.basename(source)
+        )
+        try:
+            shutil.copyfile(source, target_tmp)
+            os.replace(target_tmp, target)
+            os.remove(source)
+        finally:
+            remove_file(target_tmp)
 
     @classmethod
     def get_id(cls, metadata):
@@ -367,15 +409,40 @@ class DstProductStore:
         """ Yield existing Dst products in the given directory. """
         with os.scandir(path) as items:
             for item in items:
-                if item.is_file:
-                    match = cls.FILENAME_PATTERN.match(item.name)
-                    if match:
+                if item.is_file():
+                    parsed_name = cls._parse_filename(item.name)
+                    if parsed_name:
                         yield {
                             "name": item.name,
                             "path": item.path,
-                            **match.groupdict(),
+                            **parsed_name,
                         }
 
+    @classmethod
+    def _parse_filename(cls, name):
+        """ Parse product filename. None is returned if not a Dst product. """
+        if not (
+            len(name) == cls.FILENAME_LENGTH and
+            name.startswith(cls.FILENAME_PREFIX) and
+            name.endswith(cls.FILENAME_SUFFIX) and
+            name[23] == "_" and name[39] == "_"
+        ):
+            return None
+        parsed_name = {
+            key: name[slice_] for key, slice_ in cls.FILENAME_SLICES.items()
+        }
+        if not all(map(cls._is_timestamp, parsed_name.values())):
+            return None
+        return parsed_name
+
+    @staticmethod
+    def _is_timestamp(value):
+        """ Check if the value is a YYYYMMDDTHHMMSS timestamp. """
+        return (
+            len(value) == 15 and value[8] == "T" and
+            value[:8].isdecimal() and value[9:].isdecimal()
+        )
+
     @classmethod
     def collect_applicable(cls, products):
         """ Filter listed products and get a dictionary of applicable
@@ -385,8 +452,9 @@ class DstProductStore:
         """
 
         def _match_timestamp(value):
-            match = cls.TIMESTAP_PATTERN.match(value)
-            return match.groupdict() if match else None
+            if not cls._is_timestamp(value):
+                return None
+            return {"year": value[:4], "day": value[4:8]}
 
         def _collect_applicable(products):
             for item in products:
@@ -416,10 +484,22 @@ class DstProductStore:
     @staticmethod
     def _compare_data(data1, data2):
         """ Compare Dst data. """
-        if set(data1) != set(data2):
+
+        def _arrays_equal(array1, array2):
+            if array1.shape != array2.shape:
+                return False
+            # NOTE: The dtypes are not required to match as the loaded
+            #       timestamps' resolution differs from the parsed ones.
+            # NOTE: The NaN masks are evaluated for the NaN-able types only.
+            equal_nan = array1.dtype.kind in "fcmM"
+            return numpy.array_equal(array1, array2, equal_nan=equal_nan)
+
+        if data1.keys() != data2.keys():
             return False
-        for key in data1:
-            if not numpy.array_equal(data1[key], data2[key], equal_nan=True):
+        for key, array1 in data1.items():
+            if not _arrays_equal(
+                numpy.asarray(array1), numpy.asarray(data2[key])
+            ):
                 return False
         return True
 
@@ -512,6 +592,7 @@ class DstProduct:
                     for timestamp in metadata["timestamps"]
                 ],
                 "LAST_MODIFIED": _format_datetime(metadata["timestamp"]),
+                "CONTENT_HASH": cls.get_content_hash(data),
                 **cls.CDF_GLOBAL_ATTRIBUTES,
                 "CREATED": Timestamp.format(Timestamp.now()),
                 "CREATOR": cls.CDF_CREATOR,
@@ -524,6 +605,26 @@ class DstProduct:
             _save_cdf_variable(cdf, "Dst_Version", CDF_INT2, data["Dst_Version"])
             _save_cdf_variable(cdf, "Dst_Flag", CDF_UINT1, data["Dst_Flag"])
 
+    @staticmethod
+    def get_content_hash(data):
+        """ Get hash of the Dst data, including the variables' names, types
+        and shapes.
+        """
+        hash_ = hashlib.blake2b()
+        for variable in sorted(data):
+            array = numpy.ascontiguousarray(data[variable])
+            hash_.update(f"{variable}:{array.dtype.str}:{array.shape}".encode("utf8"))
+            hash_.update(array.view("uint8"))
+        return hash_.hexdigest()
+
+    @staticmethod
+    def load_content_hash(filename):
+        """ Load hash of the Dst data from a CDF file or None if not set. """
+        with cdf_open(filename) as cdf:
+            if "CONTENT_HASH" not in cdf.attrs:
+                return None
+            return str(cdf.attrs["CONTENT_HASH"][0])
+
     @staticmethod
     def load(filename):
         """ Load Dst data from a CDF file. """
@@ -566,29 +667,48 @@ class DstDataSource:
         )
     }
 
+    # maximum number of parallel monthly file requests
+    MAX_WORKERS = 4
+
     @classmethod
     def _get_fresh_sources(cls):
         return DstSources(cls.SOURCE_PATH_TEMPLATE)
 
+    @staticmethod
+    def _get_cache_label(year, month):
+        return f"dst-{year:04d}-{month:02d}"
+
     @classmethod
     def _get_data_path(cls, source, year, month):
         return cls.SOURCE_PATH_TEMPLATE[source].format(start=Date.create(year, month, 1))
 
     def __init__(self, cache_dir=None, logger=None):
-        self._connection = HttpConnectionFactory.from_url(self.SOURCE_BASE_URL)()
-        self._data_cache = JsonCache(cache_dir=(cache_dir or "."))
+        self._connection_factory = HttpConnectionFactory.from_url(self.SOURCE_BASE_URL)
+        self._base_url = self._connection_factory.url
+        # NOTE: HTTP connections are not thread-safe. Each parallel request
+        #       takes an idle connection from the pool or opens a new one.
+        self._connections = []
+        self._idle_connections = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._data_cache = SqliteCache(cache_dir=(cache_dir or "."))
         self._tested_sources = self._get_fresh_sources()
         self.logger = logger or logging.getLogger(__name__)
 
     def __del__(self):
-        if hasattr(self, "_connection"):
-            self._connection.close()
+        if hasattr(self, "_data_cache"):
+            self.close()
 
     def __enter__(self):
         return self
 
     def __exit__(self, *args):
-        self._connection.close()
+        self.close()
+
+    def close(self):
+        """ Close all opened connections and the data cache. """
+        for connection in self._connections:
+            connection.close()
+        self._data_cache.close()
 
     def reset_sources(self):
         """ Reset tried Dst sources """
@@ -607,10 +727,15 @@ class DstDataSource:
         def _yield_one_year_request_range_chunks(start, end):
             if start.year != (end - ONE_DAY).year:
                 raise ValueError("Time selection crosses calendar year boundary!")
-            for month in reversed(range(start.month, (end - ONE_DAY).month + 1)):
-                yield self.retrieve_monthly_data(
-                    start.year, month, check_for_updates=check_for_updates
-                )
+            year = start.year
+            months = list(reversed(
+                range(start.month, (end - ONE_DAY).month + 1)
+            ))
+            raw_files = self._retrieve_monthly_files(
+                year, months, check_for_updates=check_for_updates
+            )
+            for month in months:
+                yield self._parse_monthly_file(year, month, raw_files[month])
 
         def _calculate_ddst(chunks):
             """ Calculate dDst from a stream of time-ordered yearly chunks. """
@@ -643,30 +768,29 @@ class DstDataSource:
         Set check_for_updates flag to False if the check for updates is not
         desired for cached data.
         """
+        return self._parse_monthly_file(year, month, self.retrieve_monthly_file(
+            year=year, month=month, check_for_updates=check_for_updates
+        ))
 
-        def datetime64_to_datetime(value):
-            """ Convert numpy.datetime64 value to datetime.datetime object."""
-            us1970 = int(value.astype("datetime64[us]").astype("int64"))
-            return Timestamp.DT_1970 + datetime.timedelta(microseconds=us1970)
+    def _parse_monthly_file(self, year, month, raw_data):
 
         def get_data_extent(data):
             if data["Timestamp"].size == 0:
                 return None, None
-            return (
-                datetime64_to_datetime(data["Timestamp"][0]),
-                datetime64_to_datetime(data["Timestamp"][-1])
+            # NOTE: datetime64[us].tolist() returns naive datetime objects
+            return tuple(
+                value.replace(tzinfo=datetime.timezone.utc) for value
+                in data["Timestamp"][[0, -1]].astype("datetime64[us]").tolist()
             )
 
-        raw_data = self.retrieve_monthly_file(
-            year=year, month=month, check_for_updates=check_for_updates
-        )
         data, timestamp = DstFile.parse(
             year, month, io.StringIO(raw_data["body"])
         )
         data = DstFile.sanitize(data, raw_data["source"])
 
         metadata = {
-            "url": urllib.parse.urljoin(self._connection.url, raw_data["path"]),
+            # NOTE: the source paths are absolute
+            "url": f"{self._base_url}{raw_data['path']}",
             "source": raw_data["source"],
             "timestamp": timestamp or Timestamp.parse(raw_data["timestamp"]),
             "start": Timestamp.create(year, month, 1),
@@ -682,21 +806,94 @@ class DstDataSource:
         Set check_for_updates flag to False if the check for updates is not
         desired for cached data.
         """
-        label = f"dst-{year:04d}-{month:02d}"
-
         # retrieve cached data if existing
-        data = self._data_cache.read_data(label)
+        data = self._read_cached_monthly_file(year, month)
 
-        if data:
-            # cached data found
-            self.logger.debug("Cached %04d-%02d Dst file found.", year, month)
+        if data and not check_for_updates:
+            # use cached data without checking for updates
+            return data
+
+        return self._update_monthly_file(year, month, data)
+
+    def _retrieve_monthly_files(self, year, months, check_for_updates=True):
+        """ Retrieve monthly Dst files for the given year and months listed
+        from the most recent one. The files are requested in parallel.
+        Return dictionary of the files keyed by month.
+        """
+        # NOTE: Each parallel request skips the sources already passed
+        #       by the more recent months requested so far. Which these
+        #       are depends on the timing of the requests.
+        found_sources = {}
+
+        def _update_monthly_file(month):
+            with self._lock:
+                sources = self._tested_sources.copy()
+                for found_month, source in found_sources.items():
+                    if found_month > month:
+                        sources.advance_to(source)
+            data = self._update_monthly_file(
+                year, month, cached_files[month], sources
+            )
+            with self._lock:
+                found_sources[month] = data["source"]
+            return data
+
+        cached_files = {
+            month: self._read_cached_monthly_file(year, month)
+            for month in months
+        }
 
-            if not check_for_updates:
+        files, requested_months = {}, []
+        for month in months:
+            if cached_files[month] and not check_for_updates:
                 # use cached data without checking for updates
-                return data
+                files[month] = cached_files[month]
+            else:
+                requested_months.append(month)
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.MAX_WORKERS
+        )
+        try:
+            files.update(zip(requested_months, executor.map(
+                _update_monthly_file, requested_months
+            )))
+        finally:
+            # NOTE: On failure the pending requests are cancelled and
+            #       the ones in flight are awaited.
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        # NOTE: A file found on a less final source than a more recent month
+        #       is requested again, so that the selected sources are the same
+        #       as if the months were requested one by one.
+        for month in requested_months:
+            source = files[month]["source"]
+            if self._tested_sources.has_passed(source):
+                self.logger.debug(
+                    "%04d-%02d Dst file found in a passed source %s.",
+                    year, month, source
+                )
+                files[month] = self._update_monthly_file(year, month, None)
+            else:
+                self._tested_sources.advance_to(source)
+
+        return files
+
+    def _read_cached_monthly_file(self, year, month):
+        data = self._data_cache.read_data(self._get_cache_label(year, month))
+        if data:
+            self.logger.debug("Cached %04d-%02d Dst file found.", year, month)
+        return data
 
+    def _update_monthly_file(self, year, month, data, sources=None):
+        """ Check the cached monthly Dst file for updates and download
+        the new file if needed.
+        """
+        if data:
             # check if cached data is up-to-date (HEAD request)
-            head = self._request_monthly_file(HttpHeadRequest, year, month)
+            head = self._request_monthly_file(
+                HttpHeadRequest, year, month, sources
+            )
             if (
                 data["path"] == head["path"] and
                 data["entity_tag"] == head["entity_tag"] and
@@ -710,22 +907,43 @@ class DstDataSource:
             self.logger.debug("Cached %04d-%02d Dst file is outdated.", year, month)
 
         # retrieve new data (GET request)
-        data = self._request_monthly_file(HttpGetRequest, year, month)
+        data = self._request_monthly_file(HttpGetRequest, year, month, sources)
 
         # save new data to cache
-        self._data_cache.write_data(label, data)
+        self._data_cache.write_data(self._get_cache_label(year, month), data)
         self.logger.debug("Stored %04d-%02d Dst file to cache.", year, month)
 
         return data
 
-    def _request_monthly_file(self, request_factory, year, month):
-        while self._tested_sources:
-            source = self._tested_sources.current
+    def _get_connection(self):
+        try:
+            return self._idle_connections.get_nowait()
+        except queue.Empty:
+            connection = self._connection_factory()
+            with self._lock:
+                self._connections.append(connection)
+            return connection
+
+    def _request_monthly_file(self, request_factory, year, month,
+                              sources=None):
+        connection = self._get_connection()
+        try:
+            return self._request_monthly_file_from_sources(
+                connection, request_factory, year, month,
+                self._tested_sources if sources is None else sources,
+            )
+        finally:
+            self._idle_connections.put(connection)
+
+    def _request_monthly_file_from_sources(self, connection, request_factory,
+                                           year, month, tested_sources):
+        while tested_sources:
+            source = tested_sources.current
             request = request_factory(self._get_data_path(source, year, month))
             try:
                 return {
                     "source": source,
-                    **self._connection.request(request),
+                    **connection.request(request),
                 }
             except HttpError as error:
                 if error.status not in (404, 403):
@@ -738,7 +956,7 @@ class DstDataSource:
                     "Failed to access %s. Trying next source ...",
                     request.selector
                 )
-                self._tested_sources.set_next()
+                tested_sources.set_next()
                 continue
             except Exception as error:
                 self.logger.error(
@@ -761,34 +979,46 @@ class DstDataSource:
         if not chunks:
             raise ValueError("No chunk to be concatenated!")
 
+        # collect the chunks' metadata in one pass
+        fields = ("url", "source", "start", "end", "data_start", "data_end", "timestamp")
+        values = {field: [] for field in fields}
+        for _, metadata in chunks:
+            for field in fields:
+                values[field].append(metadata[field])
+
         result = cls.DataChunk(
             data={
                 field: numpy.concatenate([item[field] for item, _ in chunks])
                 for field in chunks[0].data
             },
             metadata={
-                "urls": [item.metadata["url"] for item in chunks],
-                "sources": {item.metadata["source"] for item in chunks},
-                "start": min(item.metadata["start"] for item in chunks),
-                "end": max(item.metadata["end"] for item in chunks),
-                "data_start": min(item.metadata["data_start"] for item in chunks),
-                "data_end": max(item.metadata["data_end"] for item in chunks),
-                "timestamp": max(item.metadata["timestamp"] for item in chunks),
-                "timestamps": [item.metadata["timestamp"] for item in chunks],
+                "urls": values["url"],
+                "sources": set(values["source"]),
+                "start": min(values["start"]),
+                "end": max(values["end"]),
+                "data_start": min(values["data_start"]),
+                "data_end": max(values["data_end"]),
+                "timestamp": max(values["timestamp"]),
+                "timestamps": values["timestamp"],
             }
         )
 
         # assuming the time-stamp is the first field
         time = result.data[list(result.data)[0]]
-        time_delta = time[1:] - time[:-1]
 
-        # assert strictly ascending time sampling
-        if time_delta.min() <= datetime.timedelta(0):
-            raise ValueError("Time is not strictly ascending!")
+        if time.size > 1:
+            # NOTE: the difference of the int64 view avoids the timedelta64
+            #       array and the datetime.timedelta scalar comparisons
+            time_delta = numpy.diff(time.view("int64"))
+            time_delta_min, time_delta_max = time_delta.min(), time_delta.max()
+
+            # assert strictly ascending time sampling
+            if time_delta_min <= 0:
+                raise ValueError("Time is not strictly ascending!")
 
-        # assert uniform time sampling
-        if time_delta.max() > time_delta.min():
-            raise ValueError("Time is not uniformly sampled!")
+            # assert uniform time sampling
+            if time_delta_max > time_delta_min:
+                raise ValueError("Time is not uniformly sampled!")
 
         return result
 
@@ -803,7 +1033,7 @@ class DstDataSource:
         time_tail = next_chunk.data["Timestamp"][0] if next_chunk else None
 
         if (
-            ((times[1:] - times[:-1]) != DstFile.SAMPLING).any() or
+            (numpy.diff(times) != DstFile.SAMPLING).any() or
             (next_chunk and (time_tail - times[-1]) != DstFile.SAMPLING)
         ):
             raise ValueError("Irregular time sampling!")
@@ -812,9 +1042,13 @@ class DstDataSource:
         dst = chunk.data["Dst"]
         dst_tail = next_chunk.data["Dst"][0] if next_chunk else numpy.nan
 
-        chunk.data["dDst"] = numpy.abs(
-            numpy.concatenate((dst[1:], [dst_tail])) - dst
-        ) / DstFile.SAMPLING_H
+        ddst = numpy.empty(dst.shape, "float64")
+        numpy.subtract(dst[1:], dst[:-1], out=ddst[:-1])
+        ddst[-1:] = dst_tail - dst[-1:]
+        numpy.abs(ddst, out=ddst)
+        ddst /= DstFile.SAMPLING_H
+
+        chunk.data["dDst"] = ddst
 
         # update metadata
         if next_chunk:
@@ -842,16 +1076,16 @@ class DstFile:
     ])}
 
     WDC_DST_RECORD_PATTERN = re.compile(
-        r"^DST(?P<year_short>\d{2,2})(?P<month>\d{2,2})\*(?P<day>\d{2,2})"
-        r"(?P<type>(RR|PP|  ))X(?P<version>(\d| ))(?P<year_prefix>(\d\d|  ))"
-        r"(?P<base_value>.{4,4})(?P<hourly_values>.{96,96})(?P<mean_value>.{4,4})"
+        r"^DST(?P<year_short>\d{2})(?P<month>\d{2})\*(?P<day>\d{2})"
+        r"(?P<type>RR|PP|  )X(?P<version>[\d ])(?P<year_prefix>\d\d|  )"
+        r"(?P<base_value>.{4})(?P<hourly_values>.{96})(?P<mean_value>.{4})"
     )
 
     WDC_DST_TIMESTAMP_PATTERN = re.compile(
-        r"^\[Created at (?P<week_day>(Mon|Tue|Wed|Thu|Fri|Sat|Sun))"
-        r" (?P<month>(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec))"
-        r" (?P<day>\d{1,2}) (?P<hour>\d{2,2}):(?P<minute>\d{2,2})"
-        r":(?P<second>\d{2,2}) UTC (?P<year>\d{4,4})\]$"
+        r"^\[Created at (?P<week_day>Mon|Tue|Wed|Thu|Fri|Sat|Sun)"
+        r" (?P<month>Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)"
+        r" (?P<day>\d{1,2}) (?P<hour>\d{2}):(?P<minute>\d{2})"
+        r":(?P<second>\d{2}) UTC (?P<year>\d{4})\]$"
     )
 
     @classmethod
@@ -872,38 +1106,29 @@ class DstFile:
         See https://wdc.kugi.kyoto-u.ac.jp/dstae/format/dstformat.html
         """
         nodata_value = 9999
-        dst_fields = ("timestamp", "dst", "version")
-        dst_dtypes = ("datetime64", "float64", "int8")
+
+        # times of the hourly values relative to the start of the day
+        hour_offsets = numpy.timedelta64(30, "m") + numpy.arange(24) * cls.SAMPLING
+        ordinal_1970 = Date.create(1970, 1, 1).toordinal()
 
         def _parse_line(year_short, year_prefix, month, day, version,
                         base_value, hourly_values, mean_value, **_):
             if year_prefix == "  ":
                 year_prefix = "19"
 
-            # check the date
-            Date.create(int(f"{year_prefix}{year_short}"), int(month), int(day))
-
-            date_ = f"{year_prefix}{year_short}-{month}-{day}"
+            # parse and check the date, converted to days since 1970-01-01
+            date_ = Date.create(
+                int(f"{year_prefix}{year_short}"), int(month), int(day)
+            ).toordinal() - ordinal_1970
             version = -1 if version == " " else int(version)
             base_value = int(base_value) * 100
-            hourly_values = [
-                int(hourly_values[idx*4:(idx + 1)*4])
-                for idx in range(24)
-            ]
-            mean_value = int(mean_value)
-
-            return {
-                "date": date_,
-                "version": version,
-                "base_value": base_value,
-                "hourly_values": hourly_values,
-                "mean_value": mean_value,
-            }
+            # NOTE: The fixed-width 4-character values are converted in bulk.
+            hourly_values = numpy.frombuffer(
+                hourly_values.encode("ascii"), "S4"
+            ).astype("int64")
+            int(mean_value) # check the mean value
 
-        def _expand_hourly_values(date, hourly_values, base_value, version, **_):
-            for hour, value in enumerate(hourly_values):
-                if value != nodata_value:
-                    yield f"{date}T{hour:02d}:30", value + base_value, version
+            return date_, version, base_value, hourly_values
 
         def _get_timestamp(year, month, day, hour, minute, second, **_):
             return Timestamp.create(
@@ -911,35 +1136,53 @@ class DstFile:
                 int(hour), int(minute), int(second),
             )
 
+        # bound pattern methods used in the per-line loop
+        match_record = cls.WDC_DST_RECORD_PATTERN.match
+        match_timestamp = cls.WDC_DST_TIMESTAMP_PATTERN.match
+
         timestamp = None
-        data = {key: [] for key in dst_fields}
+        dates, versions, base_values, hourly_values = [], [], [], []
 
         for line_no, line in enumerate(lines, 1):
             line = line.rstrip() # strip trailing white-spaces
             if not line: # skip empty lines
                 continue
             if line.startswith("DST"):
-                match = cls.WDC_DST_RECORD_PATTERN.match(line)
+                match = match_record(line)
                 try:
                     if not match:
                         raise ValueError
                     parsed_line = _parse_line(**match.groupdict())
-                    for record in _expand_hourly_values(**parsed_line):
-                        for key, value in zip(dst_fields, record):
-                            data[key].append(value)
                 except ValueError:
                     raise cls.ParsingError(
                         f"Failed to parse the {year:04d}-{month:02d} Dst "
                         f"WDC file! line {line_no}: {line}"
                     ) from None
+                for list_, value in zip(
+                    (dates, versions, base_values, hourly_values), parsed_line
+                ):
+                    list_.append(value)
                 continue
-            match = cls.WDC_DST_TIMESTAMP_PATTERN.match(line)
+            match = match_timestamp(line)
             if match:
                 timestamp = _get_timestamp(**match.groupdict())
 
+        # expand the daily records to the hourly values, skipping no-data
+        hourly_values = numpy.array(hourly_values, "int64").reshape(-1, 24)
+        is_valid = hourly_values != nodata_value
+        times = (
+            numpy.array(dates, "int64").view("datetime64[D]")
+            .astype("datetime64[m]").reshape(-1, 1) + hour_offsets
+        )
+        values = hourly_values + numpy.array(base_values, "int64").reshape(-1, 1)
+        versions = numpy.broadcast_to(
+            numpy.array(versions, "int8").reshape(-1, 1), hourly_values.shape
+        )
+
         return {
-            key: numpy.array(values, dtype)
-            for (key, values), dtype in zip(data.items(), dst_dtypes)
+            "timestamp": times[is_valid],
+            "dst": values[is_valid].astype("float64"),
+            "version": versions[is_valid],
         }, timestamp
 
 
@@ -947,7 +1190,7 @@ class DstSources:
     """ Object holding tried sources. """
 
     def __init__(self, sources):
-        self.sources = list(sources)
+        self.sources = collections.deque(sources)
 
     def __bool__(self):
         return bool(self.sources)
@@ -959,31 +1202,98 @@ class DstSources:
 
     def set_next(self):
         """ Set current source to the next available. """
-        self.sources.pop(0)
+        self.sources.popleft()
+
+    def has_passed(self, source):
+        """ Check if the given source has been already passed. """
+        return source not in self.sources
+
+    def advance_to(self, source):
+        """ Set current source to the given source unless it has been
+        already passed.
+        """
+        if source in self.sources:
+            while self.sources[0] != source:
+                self.sources.popleft()
+
+    def copy(self):
+        """ Get copy of this object. """
+        return DstSources(self.sources)
 
 
-class JsonCache:
-    """ Simple JSON file-based data cache. """
+class SqliteCache:
+    """ Simple data cache storing compressed JSON records in a single SQLite
+    database file.
+    """
+    FILENAME = "cache.sqlite"
+    # file names of the records left by the former JSON file cache
+    JSON_FILE_PATTERN = re.compile(r"^dst-\d{4}-\d{2}\.json$")
 
     def __init__(self, cache_dir=None):
         self.cache_dir = cache_dir or "."
         os.makedirs(self.cache_dir, exist_ok=True)
+        # NOTE: The connection is shared by the parallel requests.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(self.cache_dir, self.FILENAME),
+            check_same_thread=False,
+        )
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(label TEXT PRIMARY KEY, data BLOB NOT NULL)"
+            )
+        self._import_json_files()
 
-    def _get_file_path(self, name):
-        return os.path.join(self.cache_dir, f"{name}.json")
+    def _import_json_files(self):
+        """ Move the records of the former JSON file cache to the database.
+        Records already present in the database are not overwritten.
+        """
+        paths = [
+            entry.path for entry in os.scandir(self.cache_dir)
+            if entry.is_file() and self.JSON_FILE_PATTERN.match(entry.name)
+        ]
+        if not paths:
+            return
+        records = []
+        for path in paths:
+            with open(path, "rb") as file:
+                name = os.path.splitext(os.path.basename(path))[0]
+                records.append((name, zlib.compress(file.read())))
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO cache (label, data) VALUES (?, ?)",
+                records
+            )
+        for path in paths:
+            os.remove(path)
 
     def read_data(self, name):
-        """ Read data from the JSON cache. """
+        """ Read data from the cache. """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM cache WHERE label = ?", (name,)
+            ).fetchone()
+        if not row:
+            return None
         try:
-            with open(self._get_file_path(name), encoding="utf8") as file:
-                return json.load(file)
-        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return json.loads(zlib.decompress(row[0]))
+        except (zlib.error, json.decoder.JSONDecodeError):
             return None
 
     def write_data(self, name, data):
-        """ Read data from the JSON cache. """
-        with open(self._get_file_path(name), "w", encoding="utf8") as file:
-            json.dump(data, file)
+        """ Write data to the cache. """
+        blob = zlib.compress(json.dumps(data).encode("utf8"))
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (label, data) VALUES (?, ?)",
+                (name, blob)
+            )
+
+    def close(self):
+        """ Close the cache database. """
+        with self._lock:
+            self._db.close()
 
 
 class HttpError(Exception):
@@ -997,16 +1307,25 @@ class HttpError(Exception):
 class HttpRequest:
     """ Base HTTP request class. """
     RE_ETAG = re.compile(r'^(?:W/)?"(.*)"$')
+    DEFAULT_HEADERS = {
+        # the text files are transferred compressed if the server supports it
+        "Accept-Encoding": "gzip",
+    }
     method = None
 
     def __init__(self, selector, headers=None):
         self.selector = selector
-        self.headers = headers or {}
+        self.headers = {**self.DEFAULT_HEADERS, **(headers or {})}
 
     def handle_response(self, response):
         """ Handle HTTP response. """
         now = Timestamp.now()
-        body = io.TextIOWrapper(response, encoding="utf8").read()
+        # NOTE: one bulk read and decode; the newlines are translated
+        #       the same way as by the universal newlines text mode
+        body = response.read()
+        if body and response.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        body = body.decode("utf8").replace("\r\n", "\n").replace("\r", "\n")
         if response.status != 200:
             raise HttpError(response.status, response.reason, body)
         return {
@@ -1052,13 +1371,35 @@ class HttpGetRequest(HttpRequest):
 
 class HttpConnection:
     """ HTTP connection wrapper. """
+
+    # errors raised when a kept-alive connection has been closed by the server
+    CONNECTION_CLOSED_ERRORS = (
+        http.client.RemoteDisconnected,
+        ConnectionResetError,
+        BrokenPipeError,
+    )
+
     def __init__(self, url, connection, logger=None):
         self.url = url
         self.connection = connection
         self.logger = logger or logging.getLogger(__name__)
 
     def request(self, request):
-        """ Make HTTP request. """
+        """ Make HTTP request.
+        A kept-alive connection closed by the server in the meantime is
+        reopened and the request is repeated once.
+        """
+        is_reused = bool(self.connection.sock)
+        try:
+            return self._request(request)
+        except self.CONNECTION_CLOSED_ERRORS as error:
+            if not is_reused:
+                raise
+            self.logger.info("Connection to %s closed. %s", self.url, error)
+            self.connection.close()
+            return self._request(request)
+
+    def _request(self, request):
         if not self.connection.sock:
             self.logger.info("Connecting to %s", self.url)
         self.logger.info("%s %s", request.method, request.selector)
@@ -1164,6 +1505,19 @@ class Timestamp:
     def parse(cls, value):
         """Parse an ISO 8601 date-time value. The parser supports time-zones.
         """
+        try:
+            # NOTE: The C parser handles the common formats, including the Z
+            #       time-zone designator since Python 3.11.
+            value_parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return cls._parse_iso8601(value)
+        if value_parsed.tzinfo is None:
+            value_parsed = value_parsed.replace(tzinfo=datetime.timezone.utc)
+        return value_parsed.astimezone(datetime.timezone.utc)
+
+    @classmethod
+    def _parse_iso8601(cls, value):
+        """Regex-based parser of the ISO 8601 date-time value. """
         match = cls.RE_ISO_8601_DATETIME_LONG.match(value)
         if not match:
             raise ValueError("Invalid date-time input!")
@@ -1206,8 +1560,6 @@ class Timestamp:
             tz_obj,
         ).astimezone(datetime.timezone.utc)
 
-Timestamp.DT_1970 = Timestamp.create(1970, 1, 1)
-
 
 class Date:
     """ Date helpers. """
@@ -1220,7 +1572,7 @@ class Date:
     @staticmethod
     def today():
         """ Get current UTC date. """
-        return datetime.datetime.utcnow().date()
+        return datetime.datetime.now(datetime.timezone.utc).date()
 
     @staticmethod
     def parse(value):
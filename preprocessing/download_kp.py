@@ -349,7 +349,7 @@ class KpProductStore:
         """ Yield existing Kp products in the given directory. """
         with os.scandir(path) as items:
             for item in items:
-                if item.is_file:
+                if item.is_file():
                     match = cls.FILENAME_PATTERN.match(item.name)
                     if match:
                         yield {
@@ -791,7 +791,7 @@ class Date:
     @staticmethod
     def today():
         """ Get current UTC date. """
-        return datetime.datetime.utcnow().date()
+        return datetime.datetime.now(datetime.timezone.utc).date()
 
     @staticmethod
     def parse(value):
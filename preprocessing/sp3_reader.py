@@ -58,8 +58,6 @@ def main():
         print(record)
 
 
-RE_BLANKS = re.compile(r"^\s*$")
-
 RE_SP3_HEADER = [
     re.compile(
         r"^(?P<version>#[a-c])(?P<flag>[PV])"
@@ -279,7 +277,7 @@ def _read_sp3_records(source):
         return {
             key: SP3_RECORD_TYPES.get(key, str)(value)
             for key, value in data.items()
-            if not RE_BLANKS.match(value)
+            if value and not value.isspace()
         }
 
     def _break_spacecrafts(timestamp, data):
@@ -374,12 +372,11 @@ def _match(pattern, value):
 
 
 def _build_timestamp(year, month, day, hour, minute, second):
-    def _zero_pad(value):
-        return value.replace(' ', '0')
+    # NOTE: the separators contain no blanks and the zero-padding can be
+    #       applied to the whole timestamp in one step
     return (
-        f"{_zero_pad(year)}-{_zero_pad(month)}-{_zero_pad(day)}"
-        f"T{_zero_pad(hour)}:{_zero_pad(minute)}:{_zero_pad(second)}"
-    )
+        f"{year}-{month}-{day}T{hour}:{minute}:{second}"
+    ).replace(' ', '0')
 
 
 class _LineReader():
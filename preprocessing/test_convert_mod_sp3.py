@@ -47,11 +47,6 @@ RE_PRODUCT_ID = re.compile(
     r'^[A-Z0-9_]+_(\d{8,8}T\d{6,6})_(\d{8,8}T\d{6,6})_[A-Z0-9_]+$'
 )
 
-RE_TIMESTAMP = re.compile(
-    r'^(?P<year>\d{4,4})(?P<month>\d{2,2})(?P<day>\d{2,2})T'
-    r'(?P<hour>\d{2,2})(?P<minute>\d{2,2})(?P<second>\d{2,2})'
-)
-
 
 class TestError(Exception):
     """ Test error exception. """
@@ -170,7 +165,11 @@ def test_data(cdf, time_gps_ref, position_cart_ref, time_start, time_end):
         GEOCENTRIC_CARTESIAN,
     )
 
-    mask = (time_gps_ref >= time_start_gps) & (time_gps_ref < time_end_gps)
+    if (time_gps_ref[1:] >= time_gps_ref[:-1]).all():
+        # sorted times - the expected records are a contiguous slice
+        mask = slice(*time_gps_ref.searchsorted([time_start_gps, time_end_gps]))
+    else:
+        mask = (time_gps_ref >= time_start_gps) & (time_gps_ref < time_end_gps)
 
     error_count = 0
 
@@ -208,13 +207,14 @@ def read_sp3_data(filename_sp3):
 def extract_time_range(product_id):
 
     def _parse_timestamp(timestamp):
-        match = RE_TIMESTAMP.match(timestamp)
-        if not match:
-            raise ValueError(f"Invalid product timestamp {timestamp}!")
-        return datetime64(
-            "{year}-{month}-{day}T{hour}:{minute}:{second}"
-            "".format(**match.groupdict()), 'ms'
-        )
+        # NOTE: The YYYYMMDDThhmmss format is already checked by RE_PRODUCT_ID.
+        try:
+            return datetime64(
+                f"{timestamp[0:4]}-{timestamp[4:6]}-{timestamp[6:8]}T"
+                f"{timestamp[9:11]}:{timestamp[11:13]}:{timestamp[13:15]}", 'ms'
+            )
+        except ValueError:
+            raise ValueError(f"Invalid product timestamp {timestamp}!") from None
 
     match = RE_PRODUCT_ID.match(product_id)
     if not match: